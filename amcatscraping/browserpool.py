@@ -0,0 +1,128 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Pool of Selenium browsers, so scrapers running in the same process don't have to start a
+browser (and log in) every time. Browsers are keyed by whatever the scraper deems relevant,
+usually its class and credentials, and are only handed out to a scraper with the same key.
+"""
+import atexit
+import logging
+import threading
+
+from typing import Any, Callable, Hashable
+
+log = logging.getLogger(__name__)
+
+
+def quit_browser(browser):
+    try:
+        browser.quit()
+    except:
+        pass
+
+
+def is_healthy(browser) -> bool:
+    """Check whether the browser still responds, and reset it to a single window"""
+    try:
+        handles = browser.window_handles
+        for handle in handles[1:]:
+            browser.switch_to.window(handle)
+            browser.close()
+        browser.switch_to.window(handles[0])
+        return browser.execute_script("return 1") == 1
+    except Exception:
+        log.debug("Browser health check failed", exc_info=True)
+        return False
+
+
+class BrowserLease(object):
+    def __init__(self, key: Hashable, browser):
+        self.key = key
+        self.browser = browser
+        self.pages = 0
+        self.logged_in = False
+
+
+class BrowserPool(object):
+    """
+    Lease browsers with lease(), and return them with release(). Returned browsers are kept
+    idle (at most max_idle in total) until a scraper with the same key asks for one. A
+    browser is quit instead of reused if it failed its health check or has loaded more
+    than max_pages pages, to bound its memory usage.
+    """
+    def __init__(self, max_idle=4, max_pages=500):
+        self.max_idle = max_idle
+        self.max_pages = max_pages
+        self.idle = []  # oldest first
+        self.leased = set()
+        self.lock = threading.Lock()
+
+    def lease(self, key: Hashable, factory: Callable[[], Any], max_pages=None) -> BrowserLease:
+        max_pages = max_pages or self.max_pages
+        lease = self._get_idle(key, max_pages) or BrowserLease(key, factory())
+        with self.lock:
+            self.leased.add(lease)
+        return lease
+
+    def _get_idle(self, key, max_pages) -> BrowserLease:
+        while True:
+            with self.lock:
+                leases = [lease for lease in self.idle if lease.key == key]
+                if not leases:
+                    return None
+                lease = leases[-1]
+                self.idle.remove(lease)
+
+            if lease.pages < max_pages and is_healthy(lease.browser):
+                log.info("Reusing browser for {key} ({lease.pages} pages loaded)".format(**locals()))
+                return lease
+
+            log.info("Recycling browser for {key} ({lease.pages} pages loaded)".format(**locals()))
+            quit_browser(lease.browser)
+
+    def release(self, lease: BrowserLease, reuse=True, max_pages=None):
+        """Give lease back to the pool. If reuse is False (for example because the scraper
+        failed and the browser might be in a weird state), the browser is quit."""
+        max_pages = max_pages or self.max_pages
+        with self.lock:
+            self.leased.discard(lease)
+
+        if not reuse or lease.pages >= max_pages:
+            quit_browser(lease.browser)
+            return
+
+        with self.lock:
+            self.idle.append(lease)
+            nsurplus = max(0, len(self.idle) - self.max_idle)
+            surplus, self.idle = self.idle[:nsurplus], self.idle[nsurplus:]
+
+        for lease in surplus:
+            quit_browser(lease.browser)
+
+    def close(self):
+        """Quit all browsers, including those still leased"""
+        with self.lock:
+            leases = self.idle + list(self.leased)
+            self.idle, self.leased = [], set()
+        for lease in leases:
+            quit_browser(lease.browser)
+
+
+POOL = BrowserPool()
+atexit.register(POOL.close)
@@ -0,0 +1,85 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Checkpoints record which pieces of work (for example dates, or dates and editions) a scraper
+has completely scraped and uploaded, so 'scrape.py run --resume' can skip them.
+
+Scrapers announce finished work by putting a CheckpointMark in their scrape() stream, after
+the articles it produced. Scraper._run commits a mark once all articles before it are
+confirmed uploaded.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+
+from typing import Iterable
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.path.expanduser("~/.cache/scrapercheckpoints")
+
+
+class CheckpointMark(object):
+    def __init__(self, key: str):
+        self.key = key
+
+    def __repr__(self):
+        return "CheckpointMark({!r})".format(self.key)
+
+
+class Checkpoints(object):
+    """Set of completed work keys, stored as a JSON list in a file per scraper and articleset"""
+    def __init__(self, name: str, directory=CHECKPOINT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name + ".json")
+        self.lock = threading.Lock()
+
+    def _read(self) -> set:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                return set(json.load(fh))
+        except FileNotFoundError:
+            return set()
+        except ValueError:
+            log.warning("Ignoring corrupt checkpoint file {}".format(self.path))
+            return set()
+
+    def completed(self) -> set:
+        with self.lock:
+            return self._read()
+
+    def commit(self, keys: Iterable[str]):
+        keys = set(keys)
+        if not keys:
+            return
+
+        with self.lock, open(self.path + ".lock", "a") as lock_file:
+            # Other processes (such as date shards) may commit to the same file
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            completed = self._read() | keys
+            tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(sorted(completed), fh, indent=0)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp_path, self.path)
+
+        log.info("Checkpoint: completed {}".format(", ".join(sorted(keys))))
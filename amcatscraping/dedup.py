@@ -0,0 +1,334 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Stores for the keys DeduplicatingUnitScraper has seen. Keys are bytes of at most 16 bytes,
+grouped in namespaces (one per scraper, project and articleset). Available backends:
+
+ * redis: a Redis set per namespace (url: redis://host:port/db)
+ * file: a memory-mapped hash table per namespace (url: directory)
+ * bloom+redis, bloom+file: an in-process Bloom filter in front of one of the above. Keys
+   the filter has not seen are new without any I/O; only possible hits are checked against
+   the exact store.
+"""
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from typing import Iterable, List
+
+log = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+DEFAULT_REDIS_URL = "redis://127.0.0.1:6379/1"
+DEFAULT_FILE_DIR = os.path.expanduser("~/.cache/scraperdedup")
+
+
+class DeduplicationStore(object):
+    def contains(self, namespace: str, keys: List[bytes]) -> List[bool]:
+        """Return for each key whether it is in the store"""
+        raise NotImplementedError("contains() not implemented.")
+
+    def add(self, namespace: str, keys: List[bytes]):
+        raise NotImplementedError("add() not implemented.")
+
+    def iter_keys(self, namespace: str) -> Iterable[bytes]:
+        raise NotImplementedError("iter_keys() not implemented.")
+
+    def count(self, namespace: str) -> int:
+        raise NotImplementedError("count() not implemented.")
+
+
+class RedisStore(DeduplicationStore):
+    def __init__(self, url=DEFAULT_REDIS_URL):
+        import redis
+        self.redis = redis.from_url(url)
+
+    def contains(self, namespace, keys):
+        if not keys:
+            return []
+        return [bool(member) for member in self.redis.smismember(namespace, keys)]
+
+    def add(self, namespace, keys):
+        if keys:
+            self.redis.sadd(namespace, *keys)
+
+    def iter_keys(self, namespace):
+        return self.redis.sscan_iter(namespace, count=10000)
+
+    def count(self, namespace):
+        return self.redis.scard(namespace)
+
+
+class _HashSetFile(object):
+    """
+    Open-addressing hash set of keys of at most KEY_SIZE bytes in a memory-mapped file. Each
+    slot is the key length plus one (0 means empty) followed by the key, padded to KEY_SIZE.
+    The table is rebuilt at double capacity once it is half full.
+    """
+    MAGIC = b"ASDEDUP1"
+    HEADER = struct.Struct("<8sQQ")  # magic, capacity, count
+    SLOT_SIZE = KEY_SIZE + 1
+    INITIAL_CAPACITY = 1 << 16
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_file = open(path + ".lock", "a")
+        self.fh = None
+        self.map = None
+        self.inode = None
+
+    def _map(self):
+        """(Re)map the data file if another process replaced it since we last looked"""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self._create(self.path, self.INITIAL_CAPACITY)
+            inode = os.stat(self.path).st_ino
+
+        if inode != self.inode:
+            if self.map is not None:
+                self.map.close()
+                self.fh.close()
+            self.fh = open(self.path, "r+b")
+            self.map = mmap.mmap(self.fh.fileno(), 0)
+            self.inode = inode
+
+    def _create(self, path, capacity):
+        with open(path, "wb") as fh:
+            fh.write(self.HEADER.pack(self.MAGIC, capacity, 0))
+            fh.truncate(self.HEADER.size + capacity * self.SLOT_SIZE)
+
+    @property
+    def capacity(self):
+        return self.HEADER.unpack_from(self.map)[1]
+
+    @property
+    def count(self):
+        return self.HEADER.unpack_from(self.map)[2]
+
+    def _record(self, key: bytes) -> bytes:
+        if len(key) > KEY_SIZE:
+            raise ValueError("Key longer than {} bytes: {!r}".format(KEY_SIZE, key))
+        return bytes([len(key) + 1]) + key.ljust(KEY_SIZE, b"\0")
+
+    def _find(self, key: bytes):
+        """Returns (offset, found) for key: its slot if present, otherwise the empty slot where
+        it should go."""
+        capacity = self.capacity
+        slot = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") % capacity
+        record = self._record(key)
+        while True:
+            offset = self.HEADER.size + slot * self.SLOT_SIZE
+            if self.map[offset] == 0:
+                return offset, False
+            if self.map[offset:offset + self.SLOT_SIZE] == record:
+                return offset, True
+            slot = (slot + 1) % capacity
+
+    def _insert(self, key: bytes):
+        offset, found = self._find(key)
+        if not found:
+            self.map[offset:offset + self.SLOT_SIZE] = self._record(key)
+            self.HEADER.pack_into(self.map, 0, self.MAGIC, self.capacity, self.count + 1)
+
+    def _grow(self):
+        keys = list(self._iter())
+        tmp_path = self.path + ".tmp"
+        self._create(tmp_path, self.capacity * 2)
+        os.replace(tmp_path, self.path)
+        self._map()
+        for key in keys:
+            self._insert(key)
+
+    def _iter(self):
+        for slot in range(self.capacity):
+            offset = self.HEADER.size + slot * self.SLOT_SIZE
+            length = self.map[offset]
+            if length:
+                yield self.map[offset + 1:offset + length]
+
+    def contains(self, keys):
+        fcntl.flock(self.lock_file, fcntl.LOCK_SH)
+        try:
+            self._map()
+            return [self._find(key)[1] for key in keys]
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def add(self, keys):
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            self._map()
+            for key in keys:
+                if 2 * (self.count + 1) > self.capacity:
+                    self._grow()
+                self._insert(key)
+            self.map.flush()
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def keys(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_SH)
+        try:
+            self._map()
+            return list(self._iter())
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def size(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_SH)
+        try:
+            self._map()
+            return self.count
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+
+class FileStore(DeduplicationStore):
+    def __init__(self, directory=DEFAULT_FILE_DIR):
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def contains(self, namespace, keys):
+        with self.lock:
+            return self._get_file(namespace).contains(keys)
+
+    def add(self, namespace, keys):
+        with self.lock:
+            self._get_file(namespace).add(keys)
+
+    def iter_keys(self, namespace):
+        with self.lock:
+            return iter(self._get_file(namespace).keys())
+
+    def count(self, namespace):
+        with self.lock:
+            return self._get_file(namespace).size()
+
+    def _get_file(self, namespace) -> _HashSetFile:
+        if namespace not in self.files:
+            self.files[namespace] = _HashSetFile(os.path.join(self.directory, namespace + ".set"))
+        return self.files[namespace]
+
+
+class BloomFilter(object):
+    def __init__(self, capacity: int, error_rate=0.001):
+        self.capacity = capacity
+        self.nbits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.nbits for i in range(self.nhashes))
+
+    def add(self, key: bytes):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class BloomStore(DeduplicationStore):
+    """
+    Keeps a Bloom filter per namespace in memory, filled from the exact store on first use. Keys
+    the filter hasn't seen are new without any I/O. Every resync_interval seconds the filter is
+    checked against the size of the exact store, and rebuilt if another process (a parallel run
+    or shard) added keys, so those aren't taken for new for longer than that.
+    """
+    MIN_CAPACITY = 100000
+    RESYNC_INTERVAL = 60
+
+    def __init__(self, exact: DeduplicationStore, resync_interval=RESYNC_INTERVAL):
+        self.exact = exact
+        self.resync_interval = resync_interval
+        self.filters = {}
+        self.expected = {}  # number of keys the exact store holds if only we added keys
+        self.synced = {}  # time we last checked the exact store
+        self.lock = threading.Lock()
+
+    def _get_filter(self, namespace) -> BloomFilter:
+        bloom = self.filters.get(namespace)
+        now = time.monotonic()
+        if bloom is not None and bloom.count <= bloom.capacity:
+            if now - self.synced[namespace] < self.resync_interval:
+                return bloom
+            self.synced[namespace] = now
+            if self.exact.count(namespace) == self.expected[namespace]:
+                return bloom
+            log.info("Keys were added to {} by another process, rebuilding Bloom filter".format(namespace))
+
+        # (Re)build at twice the current size, so we can keep adding for a while
+        count = self.exact.count(namespace)
+        bloom = BloomFilter(max(self.MIN_CAPACITY, 2 * count))
+        for key in self.exact.iter_keys(namespace):
+            bloom.add(key)
+        self.filters[namespace] = bloom
+        self.expected[namespace] = count
+        self.synced[namespace] = now
+        return bloom
+
+    def contains(self, namespace, keys):
+        with self.lock:
+            bloom = self._get_filter(namespace)
+            maybe = [key in bloom for key in keys]
+
+        # Only ask the exact store about keys the filter might have seen
+        candidates = [key for key, hit in zip(keys, maybe) if hit]
+        if not candidates:
+            return maybe
+        found = iter(self.exact.contains(namespace, candidates))
+        return [hit and next(found) for hit in maybe]
+
+    def add(self, namespace, keys):
+        with self.lock:
+            bloom = self._get_filter(namespace)
+            self.exact.add(namespace, keys)
+            for key in keys:
+                bloom.add(key)
+            self.expected[namespace] += len(keys)
+
+    def iter_keys(self, namespace):
+        return self.exact.iter_keys(namespace)
+
+    def count(self, namespace):
+        return self.exact.count(namespace)
+
+
+def get_store(backend="redis", url=None) -> DeduplicationStore:
+    """Create a store from its configuration, see module documentation"""
+    if backend.startswith("bloom+"):
+        return BloomStore(get_store(backend[len("bloom+"):], url))
+    if backend == "redis":
+        return RedisStore(url or DEFAULT_REDIS_URL)
+    if backend == "file":
+        return FileStore(url or DEFAULT_FILE_DIR)
+    raise ValueError("Unknown deduplication backend: {}".format(backend))
@@ -0,0 +1,148 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Read files while a browser downloads them. Firefox writes a download to '<name>.part' and
+renames it to '<name>' when it is complete, so stream_download follows the .part file as it
+grows and stops at its end once the .part file is gone.
+
+Changes to the download directory are watched with inotify if inotify_simple is installed,
+and polled otherwise.
+"""
+import fnmatch
+import logging
+import os
+import time
+
+from typing import Iterator, Optional
+
+log = logging.getLogger(__name__)
+
+PART_SUFFIX = ".part"
+
+
+class DirectoryWatcher(object):
+    """Waits for changes in a directory"""
+    def __init__(self, directory: str, poll_interval=0.3, inotify=True):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.inotify = None
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            log.debug("inotify_simple not installed, polling {}".format(directory))
+            inotify = False
+        if inotify:
+            self.inotify = INotify()
+            mask = flags.CREATE | flags.MODIFY | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE
+            self.inotify.add_watch(directory, mask)
+
+    def wait(self, timeout: float):
+        """Wait until something changed in the directory, or at most timeout seconds"""
+        if self.inotify is None:
+            time.sleep(max(0.0, min(timeout, self.poll_interval)))
+        else:
+            self.inotify.read(timeout=max(0, int(timeout * 1000)))
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+def _find(directory: str, pattern: str) -> Optional[str]:
+    """Return the (partial) download matching pattern, preferring the .part file"""
+    names = os.listdir(directory)
+    for name in names:
+        if name.endswith(PART_SUFFIX) and fnmatch.fnmatch(name[:-len(PART_SUFFIX)], pattern):
+            return os.path.join(directory, name)
+    for name in names:
+        if fnmatch.fnmatch(name, pattern):
+            return os.path.join(directory, name)
+    return None
+
+
+def _is_placeholder(path: str) -> bool:
+    if path.endswith(PART_SUFFIX):
+        return False
+    try:
+        return os.path.getsize(path) == 0
+    except OSError:
+        return True
+
+
+def stream_download(directory: str, pattern: str, timeout=180.0, idle_timeout=600.0, delete=True,
+                    poll_interval=0.3, inotify=True) -> Iterator[str]:
+    """
+    Yield the lines of the file matching pattern that is being downloaded into directory, as
+    soon as they are written.
+
+    @param timeout: seconds to wait for the download to start
+    @param idle_timeout: seconds to wait for the download to grow (or finish)
+    @param delete: remove the file once it has been read
+    @param poll_interval, inotify: see DirectoryWatcher
+    """
+    watcher = DirectoryWatcher(directory, poll_interval, inotify)
+    try:
+        deadline = time.monotonic() + timeout
+        path = _find(directory, pattern)
+        # Firefox may create an empty placeholder for the final file before the .part file
+        while path is None or _is_placeholder(path):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IOError("Did not find {} in {} within {} seconds".format(pattern, directory, timeout))
+            watcher.wait(remaining)
+            path = _find(directory, pattern)
+
+        log.info("Reading {} while it is downloaded".format(path))
+        final_path = path[:-len(PART_SUFFIX)] if path.endswith(PART_SUFFIX) else path
+        try:
+            # Opening the .part file keeps it readable after Firefox renames it
+            with open(path, "rb") as fh:
+                yield from _follow(fh, path, watcher, idle_timeout)
+        finally:
+            if delete:
+                for p in (path, final_path):
+                    if os.path.exists(p):
+                        os.remove(p)
+    finally:
+        watcher.close()
+
+
+def _follow(fh, path: str, watcher: DirectoryWatcher, idle_timeout: float) -> Iterator[str]:
+    buffer = b""
+    first = True
+    deadline = time.monotonic() + idle_timeout
+    while True:
+        # Check whether the download is complete before reading, so we can't miss the last data
+        complete = not os.path.exists(path) or not path.endswith(PART_SUFFIX)
+        data = fh.read()
+        if data:
+            deadline = time.monotonic() + idle_timeout
+            *lines, buffer = (buffer + data).split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8-sig" if first else "utf-8") + "\n"
+                first = False
+        elif complete:
+            if buffer:
+                yield buffer.decode("utf-8-sig" if first else "utf-8")
+            return
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IOError("Download {} did not progress for {} seconds".format(path, idle_timeout))
+            watcher.wait(remaining)
@@ -0,0 +1,172 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+On-disk cache of HTTP responses, used by httpsession.Session if configured. Responses are
+stored zlib-compressed in an SQLite database. A response younger than the TTL of its domain is
+returned without any request; older responses are revalidated using their ETag or
+Last-Modified header, so an unchanged page costs a '304 Not Modified' instead of a download.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+log = logging.getLogger(__name__)
+
+CACHE_PATH = os.path.expanduser("~/.cache/scraperhttp.sqlite3")
+
+# Request headers which influence the response, and are therefore part of the cache key
+KEY_HEADERS = ("Accept", "Accept-Language")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+class ResponseCache(object):
+    """
+    @param path: SQLite database to store responses in
+    @param max_size: evict least recently used responses when compressed bodies exceed this many bytes
+    @param default_ttl: seconds a response can be used without revalidation
+    @param ttls: per domain TTLs, which also apply to subdomains
+    """
+    def __init__(self, path=CACHE_PATH, max_size=1024 ** 3, default_ttl=0, ttls: Dict[str, float]=None):
+        self.path = path
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.lock = threading.Lock()
+        self.db = None
+        self.size = None
+
+    def _connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self.db
+
+    def get_ttl(self, url: str) -> float:
+        hostname = urlparse(url).hostname or ""
+        parts = hostname.split(".")
+        for i in range(len(parts)):
+            domain = ".".join(parts[i:])
+            if domain in self.ttls:
+                return self.ttls[domain]
+        return self.default_ttl
+
+    def get_key(self, url: str, headers) -> str:
+        key = [url] + ["{}: {}".format(h, headers.get(h, "")) for h in KEY_HEADERS]
+        return hashlib.sha256("\n".join(key).encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[requests.Response]:
+        """Returns the cached response for key, with its age in seconds in response.cache_age"""
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT url, status, headers, body, stored FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+
+        url, status, headers, body, stored = row
+        response = requests.Response()
+        response.url = url
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict(json.loads(headers))
+        response._content = zlib.decompress(body)
+        response.cache_age = time.time() - stored
+        response.from_cache = True
+        return response
+
+    def refresh(self, key: str):
+        """Mark a cached response as revalidated"""
+        with self.lock:
+            now = time.time()
+            self._connect().execute("UPDATE responses SET stored = ?, accessed = ? WHERE key = ?", (now, now, key))
+
+    def store(self, key: str, response: requests.Response):
+        body = zlib.compress(response.content)
+        headers = json.dumps(dict(response.headers))
+        now = time.time()
+        with self.lock:
+            db = self._connect()
+            old = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, response.url, response.status_code, headers, body, len(body), now, now))
+            self.size += len(body) - (old[0] if old else 0)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used responses until we're at 90% of max_size"""
+        target = self.max_size * 0.9
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed")
+        evict = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            evict.append((key,))
+            self.size -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", evict)
+        log.info("Evicted {} responses from HTTP cache".format(len(evict)))
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+def get_cache(options: Dict[str, str]) -> Optional[ResponseCache]:
+    """
+    Create a cache from the [http_cache] section of the configuration. Options: enabled,
+    path, max_size (in MB), ttl (default TTL in seconds) and ttl.<domain> for per domain TTLs.
+    Returns None if the cache is not enabled.
+    """
+    if options.get("enabled", "no").lower() not in ("y", "yes", "1", "true", "on"):
+        return None
+
+    ttls = {key[len("ttl."):]: float(value) for key, value in options.items() if key.startswith("ttl.")}
+    return ResponseCache(
+        path=os.path.expanduser(options.get("path", CACHE_PATH)),
+        max_size=int(float(options.get("max_size", 1024)) * 1024 ** 2),
+        default_ttl=float(options.get("ttl", 0)),
+        ttls=ttls
+    )
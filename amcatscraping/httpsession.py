@@ -22,6 +22,8 @@ import lxml.html
 import requests
 import time
 
+from amcatscraping.ratelimit import RateLimiter, THROTTLE_STATUSES
+
 
 class RedirectError(Exception):
     def __init__(self, status_code, *args, **kwargs):
@@ -29,10 +31,21 @@ class RedirectError(Exception):
         self.status_code = status_code
 
 
+# Arguments to get() that don't prevent caching its response
+CACHEABLE_KWARGS = {"params", "headers", "timeout"}
+
+
 class Session(requests.Session):
     """Provides a HTTP session, HTML parsing and a few convenience methods"""
-    def __init__(self):
+    def __init__(self, cache=None, limiter=None):
+        """
+        @param cache: httpcache.ResponseCache used by get_content and get_html, if given
+        @param limiter: ratelimit.RateLimiter deciding when requests may be done. By default
+                        requests are not limited, but hosts asking us to slow down are backed off.
+        """
         super(Session, self).__init__()
+        self.cache = cache
+        self.limiter = limiter or RateLimiter()
         self.sleep = 0
         self.encoding = "utf-8"
         self.headers.update({
@@ -45,7 +58,10 @@ class Session(requests.Session):
         return result
 
     def get_content(self, link, **kwargs):
-        response = self.get(link, **kwargs)
+        if self.cache is not None and set(kwargs) <= CACHEABLE_KWARGS:
+            response = self.get_cached(link, **kwargs)
+        else:
+            response = self.get(link, **kwargs)
         response.raise_for_status()
         content = response.content  # type: bytes
         return content.decode(self.encoding)
@@ -59,14 +75,45 @@ class Session(requests.Session):
           #  return None
         return response.headers["Location"]
 
-    def get(self, link, tries=3, **kwargs):
-        time.sleep(self.sleep)
+    def get_cached(self, link, params=None, headers=None, **kwargs):
+        """Like get(), but uses (and revalidates) responses in self.cache"""
+        request = self.prepare_request(requests.Request("GET", link.strip(), params=params, headers=headers))
+        key = self.cache.get_key(request.url, request.headers)
+        cached = self.cache.lookup(key)
 
-        try:
-            return super(Session, self).get(link.strip(), **kwargs)
-        except Exception:
-            if tries == 1:
-                raise
-            time.sleep(2)
-            return self.get(link, tries=tries - 1, **kwargs)
+        if cached is not None:
+            if cached.cache_age < self.cache.get_ttl(request.url):
+                return cached
+            headers = dict(headers or {})
+            if "ETag" in cached.headers:
+                headers["If-None-Match"] = cached.headers["ETag"]
+            if "Last-Modified" in cached.headers:
+                headers["If-Modified-Since"] = cached.headers["Last-Modified"]
 
+        response = self.get(request.url, headers=headers, **kwargs)
+
+        if cached is not None and response.status_code == 304:
+            self.cache.refresh(key)
+            return cached
+
+        cache_control = response.headers.get("Cache-Control", "")
+        if response.status_code == 200 and "no-store" not in cache_control:
+            self.cache.store(key, response)
+        return response
+
+    def get(self, link, tries=3, **kwargs):
+        """Get link, retrying failed requests and throttled responses (429, 503) up to tries times"""
+        link = link.strip()
+        for attempt in range(1, tries + 1):
+            time.sleep(self.sleep)
+            with self.limiter.request(link) as slot:
+                try:
+                    response = super(Session, self).get(link, **kwargs)
+                except Exception:
+                    slot.failed()
+                    if attempt == tries:
+                        raise
+                    continue
+                slot.record(response)
+            if response.status_code not in THROTTLE_STATUSES or attempt == tries:
+                return response
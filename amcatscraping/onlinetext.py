@@ -0,0 +1,197 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Retrieve the texts of online news articles using the site specific scrapers of
+scrapers.news.online_scrapers (or dutch_news_scrapers), found for each link by a
+ScraperRouter. scrape_texts fetches a batch of links concurrently on one aiohttp client,
+limiting the number of simultaneous requests to each host, and parses the pages in a thread
+pool. Site scrapers without scrape_text_async run their blocking scrape_text in that pool.
+"""
+import asyncio
+import collections
+import functools
+import itertools
+import logging
+import queue
+import re
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 6.3; rv:36.0) Gecko/20100101 Firefox/36.0"
+
+
+class NoScraper(Exception):
+    pass
+
+
+class ScraperRouter(object):
+    """
+    Finds the site scraper for a link by looking up the host name (and its parent domains)
+    in a dictionary, instead of asking each scraper whether it can scrape the link.
+    """
+    def __init__(self, scrapers: Iterable=()):
+        self.domains = collections.defaultdict(list)  # domain -> [(compiled pattern or None, scraper)]
+        self.fallback = []  # [(compiled pattern or None, scraper)]
+        for scraper in scrapers:
+            self.add(scraper)
+
+    def add(self, scraper, domain: str=None, pattern: str=None):
+        """
+        @param domain: domain the scraper handles, including subdomains. Defaults to scraper.DOMAIN.
+        @param pattern: regular expression links must match (from the start). Defaults to scraper.URL_MATCH;
+                        if neither is given, links are checked with scraper.can_scrape().
+        Scrapers without a domain are only tried for links no other scraper takes.
+        """
+        domain = domain or getattr(scraper, "DOMAIN", None)
+        pattern = pattern or getattr(scraper, "URL_MATCH", None)
+        entry = (re.compile(pattern) if pattern else None, scraper)
+        if not domain:
+            self.fallback.append(entry)
+            return
+        domain = domain.lower().strip(".")
+        if domain.startswith("www."):
+            domain = domain[len("www."):]
+        self.domains[domain].append(entry)
+
+    def route(self, link: str):
+        hostname = (urlparse(link).hostname or "").lower()
+        parts = hostname.split(".")
+        candidates = [self.domains.get(".".join(parts[i:]), ()) for i in range(len(parts))]
+        for regex, scraper in itertools.chain(*candidates, self.fallback):
+            if regex.match(link) if regex else scraper.can_scrape(link):
+                return scraper
+        raise NoScraper("No scraper for {}".format(link))
+
+
+class HostPool(object):
+    """
+    Thread pool running at most per_host tasks for the same host at a time, so one slow or
+    strict site doesn't occupy all workers. Results can be retrieved in the order they complete.
+    """
+    def __init__(self, workers=16, per_host=2):
+        self.workers = workers
+        self.per_host = per_host
+        self.executor = ThreadPoolExecutor(workers)
+        self.waiting = collections.OrderedDict()  # type: Dict[str, collections.deque]
+        self.active = collections.Counter()
+        self.running = 0
+        self.pending = 0
+        self.lock = threading.RLock()
+        self.results = queue.Queue()
+
+    def submit(self, host: str, key: Any, fn: Callable, *args):
+        """Run fn(*args); its result is returned by get() as (key, future)"""
+        with self.lock:
+            self.waiting.setdefault(host, collections.deque()).append((key, fn, args))
+            self.pending += 1
+            self._dispatch()
+
+    def _dispatch(self):
+        for host in list(self.waiting):
+            tasks = self.waiting[host]
+            while tasks and self.active[host] < self.per_host and self.running < self.workers:
+                key, fn, args = tasks.popleft()
+                self.active[host] += 1
+                self.running += 1
+                future = self.executor.submit(fn, *args)
+                future.add_done_callback(functools.partial(self._done, host, key))
+            # Let other hosts go first next time
+            del self.waiting[host]
+            if tasks:
+                self.waiting[host] = tasks
+
+    def _done(self, host, key, future):
+        self.results.put((key, future))
+        with self.lock:
+            self.active[host] -= 1
+            self.running -= 1
+            self._dispatch()
+
+    def get(self, block=True) -> Optional[Tuple[Any, Future]]:
+        """Return (key, future) of a completed task, or None if not blocking and none completed"""
+        try:
+            item = self.results.get(block)
+        except queue.Empty:
+            return None
+        with self.lock:
+            self.pending -= 1
+        return item
+
+    def shutdown(self):
+        with self.lock:
+            self.waiting.clear()
+        self.executor.shutdown(wait=False)
+
+
+def get_text(router: ScraperRouter, link: str, limiter=None) -> str:
+    scraper = router.route(link)
+    log.debug("Scraping {} with {}".format(link, scraper))
+    if limiter is None:
+        return scraper.scrape_text(link)
+    with limiter.request(link):
+        return scraper.scrape_text(link)
+
+
+async def _scrape_texts(links, router, workers, per_host, limiter):
+    import aiohttp
+
+    loop = asyncio.get_event_loop()
+    hosts = collections.defaultdict(lambda: asyncio.Semaphore(per_host))
+
+    async def fetch(client, executor, link):
+        scraper = router.route(link)
+        log.debug("Scraping {} with {}".format(link, scraper))
+        if hasattr(scraper, "scrape_text_async"):
+            return await scraper.scrape_text_async(client, link, executor)
+        return await loop.run_in_executor(executor, scraper.scrape_text, link)
+
+    async def scrape(client, executor, link):
+        # Waiting for a host or the rate limiter happens here, so it doesn't occupy a thread
+        async with hosts[urlparse(link).hostname]:
+            if limiter is None:
+                return await fetch(client, executor, link)
+            with await limiter.request_async(link):
+                return await fetch(client, executor, link)
+
+    connector = aiohttp.TCPConnector(limit=workers, limit_per_host=per_host)
+    headers = {"User-Agent": USER_AGENT}
+    with ThreadPoolExecutor(workers) as executor:
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as client:
+            return await asyncio.gather(*(scrape(client, executor, link) for link in links), return_exceptions=True)
+
+
+def scrape_texts(links: Sequence[str], router: ScraperRouter, workers=16, per_host=4,
+                 limiter=None) -> Dict[str, Union[str, Exception]]:
+    """
+    Scrape the texts of links concurrently.
+
+    @param router: finds the site scraper for each link
+    @param workers: maximum number of links scraped at a time
+    @param per_host: maximum number of links scraped at a time per host
+    @param limiter: ratelimit.RateLimiter to throttle requests with, optional
+    @return: a dictionary mapping each link to its text, or to the exception raised while scraping it
+    """
+    links = list(dict.fromkeys(links))
+    results = asyncio.run(_scrape_texts(links, router, workers, per_host, limiter))
+    return dict(zip(links, results))
@@ -0,0 +1,259 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Per host politeness for HTTP requests. Each host gets a token bucket (a maximum number of
+requests per second) and a maximum number of concurrent requests. Failed requests and
+'429 Too Many Requests' / '503 Service Unavailable' responses block the host for an
+exponentially growing, jittered period (or as long as its Retry-After header asks) and halve
+its rate; fast successful responses slowly raise the rate again, up to max_rate.
+"""
+import asyncio
+import collections
+import datetime
+import email.utils
+import logging
+import random
+import threading
+import time
+
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+# Seconds between checks of request_async() waiting for a running request to finish
+POLL_INTERVAL = 0.05
+
+# Response statuses meaning: slow down
+THROTTLE_STATUSES = {429, 503}
+
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+RETRY_AFTER_MAX = 900.0
+
+
+HostPolicy = collections.namedtuple("HostPolicy", ["rate", "max_rate", "concurrency", "latency"])
+HostPolicy.__doc__ = """
+@param rate: initial number of requests per second, or 0 for no limit
+@param max_rate: number of requests per second to which the rate may increase when responses are fast
+@param concurrency: maximum number of simultaneous requests, or 0 for no limit
+@param latency: responses faster than this number of seconds count as healthy
+"""
+
+UNLIMITED = HostPolicy(rate=0, max_rate=0, concurrency=0, latency=2.0)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) to a number of seconds"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        seconds = (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return min(RETRY_AFTER_MAX, max(0.0, seconds))
+
+
+class HostState(object):
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.rate = policy.rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.active = 0
+        self.failures = 0
+        self.blocked_until = 0.0
+
+    def get_wait(self, now: float) -> Optional[float]:
+        """Seconds to wait before a request may start, or None to wait for a running request"""
+        if self.policy.concurrency and self.active >= self.policy.concurrency:
+            return None
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.rate:
+            burst = max(1.0, self.rate)
+            self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+        return 0
+
+    def start(self):
+        self.active += 1
+        if self.rate:
+            self.tokens -= 1
+
+    def succeeded(self, latency: float):
+        self.failures = 0
+        if self.rate and latency < self.policy.latency and self.rate < self.policy.max_rate:
+            # Additive increase..
+            self.rate = min(self.policy.max_rate, self.rate + self.policy.rate / 10)
+
+    def throttled(self, now: float, retry_after: Optional[float]):
+        # ..multiplicative decrease
+        self.failures += 1
+        if self.rate:
+            self.rate = max(self.policy.rate / 16, self.rate / 2)
+        if retry_after is None:
+            backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+            retry_after = backoff * random.uniform(0.5, 1.5)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        return retry_after
+
+
+class Slot(object):
+    """A running request. Report its outcome using record(), succeeded() or failed()."""
+    def __init__(self, limiter: "RateLimiter", host: str, state: HostState):
+        self.limiter = limiter
+        self.host = host
+        self.state = state
+        self.started = time.monotonic()
+        self.done = False
+
+    def record(self, response):
+        self._record(response.status_code, response.headers)
+
+    def _record(self, status, headers):
+        if status in THROTTLE_STATUSES:
+            self.failed(parse_retry_after(headers.get("Retry-After")))
+        else:
+            self.succeeded()
+
+    def succeeded(self):
+        self.limiter.release(self, failed=False)
+
+    def failed(self, retry_after: Optional[float]=None):
+        self.limiter.release(self, failed=True, retry_after=retry_after)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.done:
+            return
+        # A requests.HTTPError or aiohttp.ClientResponseError tells us whether the host asked us to slow down
+        response = getattr(exc_val, "response", None)
+        if response is not None:
+            self.record(response)
+        elif isinstance(getattr(exc_val, "status", None), int):
+            self._record(exc_val.status, exc_val.headers or {})
+        else:
+            self.limiter.release(self, failed=exc_type is not None)
+
+
+class RateLimiter(object):
+    """
+    @param default: policy for hosts not in policies
+    @param policies: per domain policies, which also apply to subdomains
+    """
+    def __init__(self, default: HostPolicy=UNLIMITED, policies: Dict[str, HostPolicy]=None):
+        self.default = default
+        self.policies = policies or {}
+        self.hosts = {}  # type: Dict[str, HostState]
+        self.condition = threading.Condition()
+
+    def get_policy(self, host: str) -> HostPolicy:
+        parts = host.split(".")
+        for i in range(len(parts)):
+            domain = ".".join(parts[i:])
+            if domain in self.policies:
+                return self.policies[domain]
+        return self.default
+
+    def _get_state(self, host: str) -> HostState:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.get_policy(host))
+        return state
+
+    def request(self, url: str) -> Slot:
+        """Block until a request to url is allowed. Use the result as a context manager."""
+        host = urlparse(url).hostname or ""
+        with self.condition:
+            state = self._get_state(host)
+            while True:
+                wait = state.get_wait(time.monotonic())
+                if wait == 0:
+                    break
+                self.condition.wait(wait)
+            state.start()
+        return Slot(self, host, state)
+
+    def try_request(self, url: str) -> Tuple[Optional[Slot], Optional[float]]:
+        """Returns (slot, 0) if a request to url is allowed now, otherwise (None, seconds to wait),
+        where seconds is None if a running request has to finish first"""
+        host = urlparse(url).hostname or ""
+        with self.condition:
+            state = self._get_state(host)
+            wait = state.get_wait(time.monotonic())
+            if wait != 0:
+                return None, wait
+            state.start()
+        return Slot(self, host, state), 0
+
+    async def request_async(self, url: str) -> Slot:
+        """Like request(), but waits in the event loop instead of blocking a thread"""
+        while True:
+            slot, wait = self.try_request(url)
+            if slot is not None:
+                return slot
+            await asyncio.sleep(POLL_INTERVAL if wait is None else wait)
+
+    def release(self, slot: Slot, failed: bool, retry_after: Optional[float]=None):
+        if slot.done:
+            return
+        slot.done = True
+        now = time.monotonic()
+        with self.condition:
+            state = slot.state
+            state.active -= 1
+            if failed:
+                delay = state.throttled(now, retry_after)
+                log.warning("Backing off from {} for {:.1f} seconds (rate: {:.2f}/s)".format(
+                    slot.host, delay, state.rate))
+            else:
+                state.succeeded(now - slot.started)
+            self.condition.notify_all()
+
+
+def get_limiter(options: Dict[str, str]) -> RateLimiter:
+    """
+    Create a rate limiter from the [rate_limit] section of the configuration. Options: rate,
+    max_rate, concurrency and latency, each of which can be given per domain as
+    <option>.<domain>.
+    """
+    def get_policy(suffix=""):
+        def get(name, fallback):
+            return float(options.get(name + suffix, options.get(name, fallback)))
+        rate = get("rate", UNLIMITED.rate)
+        return HostPolicy(
+            rate=rate,
+            max_rate=max(rate, get("max_rate", rate)),
+            concurrency=int(get("concurrency", UNLIMITED.concurrency)),
+            latency=get("latency", UNLIMITED.latency)
+        )
+
+    domains = {key.split(".", 1)[1] for key in options if "." in key}
+    return RateLimiter(get_policy(), {domain: get_policy("." + domain) for domain in domains})
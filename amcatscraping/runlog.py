@@ -0,0 +1,155 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Store of scraper run results and their logs, used by scrape.py. Every run of a scraper is a row
+in an SQLite database, indexed on its uuid, time and label; logs are stored zlib-compressed. Older
+versions wrote a JSON file per run to LOG_DIR/YYYY-MM-DD/, which are imported when the database
+is created.
+"""
+import datetime
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+from typing import Iterable, List, Optional
+
+log = logging.getLogger(__name__)
+
+LOG_PATH = os.path.expanduser("~/.cache/scraperlogs.sqlite3")
+LEGACY_LOG_DIR = os.path.expanduser("~/.cache/scraperlogs/")
+
+# Columns returned by get_runs; get_run adds the log text
+COLUMNS = ("uuid", "label", "timestamp", "narticles", "update", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    uuid TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    narticles INTEGER NOT NULL,
+    "update" INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    log BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+CREATE INDEX IF NOT EXISTS runs_label ON runs (label, timestamp);
+"""
+
+# Stored in PRAGMA user_version, so legacy logs are imported only once
+SCHEMA_VERSION = 1
+
+
+def _to_timestamp(date: datetime.date) -> int:
+    """Unix timestamp of the start of date, in local time (like the legacy day directories)"""
+    return int(time.mktime(date.timetuple()))
+
+
+class RunLog(object):
+    """
+    @param path: SQLite database to store runs in
+    @param legacy_dir: directory with JSON logs of older versions, imported when the database is created
+    """
+    def __init__(self, path=LOG_PATH, legacy_dir=LEGACY_LOG_DIR):
+        self.path = path
+        self.legacy_dir = legacy_dir
+        self.lock = threading.Lock()
+        self.db = None
+
+    def _connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            if self.db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                if self.legacy_dir and os.path.isdir(self.legacy_dir):
+                    self._import_legacy(self.legacy_dir)
+                self.db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        return self.db
+
+    def _import_legacy(self, directory):
+        rows = []
+        for file in glob.glob(os.path.join(directory, "*", "*.json")):
+            try:
+                with open(file) as fh:
+                    run = json.load(fh)
+                rows.append(self._get_row(run["uuid"], run["label"], run["timestamp"], run["narticles"],
+                                          run.get("update"), run.get("failed"), run.get("log") or ""))
+            except (ValueError, KeyError):
+                log.warning("Could not import run log {}".format(file))
+        self.db.execute("BEGIN")
+        self.db.executemany("INSERT OR IGNORE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.execute("COMMIT")
+        log.info("Imported {} run logs from {}".format(len(rows), directory))
+
+    def _get_row(self, identifier, label, timestamp, narticles, update, failed, text):
+        return (identifier, label, int(timestamp), narticles, bool(update), bool(failed),
+                zlib.compress(text.encode("utf-8")))
+
+    def add(self, label: str, narticles: int, failed: bool, text: str, update=False, timestamp=None) -> str:
+        """Store the result of a scraper run, returning its uuid"""
+        identifier = str(uuid.uuid4())
+        timestamp = time.time() if timestamp is None else timestamp
+        row = self._get_row(identifier, label, timestamp, narticles, update, failed, text)
+        with self.lock:
+            self._connect().execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+        return identifier
+
+    def get_run(self, identifier: str) -> Optional[dict]:
+        """Return the run with the given uuid, including its log text in 'log'"""
+        with self.lock:
+            row = self._connect().execute(
+                'SELECT uuid, label, timestamp, narticles, "update", failed, log FROM runs WHERE uuid = ?',
+                (identifier,)).fetchone()
+        if row is None:
+            return None
+        run = dict(zip(COLUMNS, row))
+        run["log"] = zlib.decompress(row[-1]).decode("utf-8")
+        return run
+
+    def get_runs(self, min_date: datetime.date, max_date: datetime.date=None,
+                 labels: Iterable[str]=()) -> List[dict]:
+        """
+        Return runs (without their logs) from min_date up to and including max_date, ordered by
+        label and time.
+
+        @param labels: only return runs of these scrapers, if given
+        """
+        max_date = min_date if max_date is None else max_date
+        query = 'SELECT uuid, label, timestamp, narticles, "update", failed FROM runs WHERE timestamp >= ? AND timestamp < ?'
+        params = [_to_timestamp(min_date), _to_timestamp(max_date + datetime.timedelta(days=1))]
+        labels = list(labels)
+        if labels:
+            query += " AND label IN ({})".format(", ".join("?" * len(labels)))
+            params += labels
+        with self.lock:
+            rows = self._connect().execute(query + " ORDER BY label, timestamp", params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -20,9 +20,11 @@
 
 Usage:
   scrape.py run [options] [<scraper>...]
+  scrape.py daemon [options] [<scraper>...]
   scrape.py list
-  scrape.py report [--email] [--date=<date>]
+  scrape.py report [--email] [--date=<date>] [--days=<n>] [<scraper>...]
   scrape.py log <uuid>
+  scrape.py flush-spool
   scrape.py -h | --help
 
 Options:
@@ -36,33 +38,43 @@ Options:
   --batch-size=<n>         If running in batched mode, this determines the batch size. For continuous
                            scrapers a low value is suitable for "real-time" purposes (default: 100).
   --update                 Update comment threads of existing articles
+  --upload-queue=<n>       Number of batches that may wait for upload while scraping continues. Use 0
+                           to pause scraping while a batch is uploaded (default: 2).
+  --workers=<n>            Number of units scraped concurrently by unit-based scrapers. Overrides
+                           the 'workers' option of a scraper section (default: 1).
+  --resume                 Skip dates which were completely scraped and uploaded by an earlier run.
+  --parallel=<n>           Run each scraper in its own process, with at most n processes at a time.
+  --shard-dates=<n>        Split the date range of date based scrapers into n parts, each scraped in
+                           its own process (in parallel, unless limited by --parallel).
+  --timeout=<seconds>      Kill scrapers running longer than this. Overrides the 'timeout' option of
+                           a scraper section. Only applies when running with --parallel.
+  --date=<date>            Report runs of this date (default: today)
+  --days=<n>               Report runs of the n days up to and including --date (default: 1).
 
 """
-import amcatscraping.setup_django
-import amcatscraping.scraper
+import amcatscraping
 import configparser
+import contextlib
 import collections
-import glob
+import heapq
+import importlib
 import io
-import json
 import logging
+import multiprocessing
+import multiprocessing.connection
 import os.path
+import signal
 import sys
-import jinja2
+import threading
+import time
+import traceback
 import datetime
-import tabulate
-import uuid
-import errno
 
-from iso8601.iso8601 import parse_date
-from email.utils import formatdate
-from django.core.mail import EmailMultiAlternatives, get_connection
+from amcatscraping.runlog import RunLog
 from amcatscraping.tools import get_boolean, to_date
 
-
-JINJA_ENV = jinja2.Environment(loader=jinja2.PackageLoader('amcatscraping', 'templates'))
-EMAIL_TEMPLATE = JINJA_ENV.get_template('log_email.html')
-
+# Django, Selenium, the AmCAT client and the scrapers take seconds to import, so they are
+# imported by the subcommands which need them. This keeps 'list', 'report' and 'log' fast.
 
 log = logging.getLogger(__name__)
 
@@ -70,16 +82,26 @@ MODULE_PATH = os.path.abspath(os.path.join(*amcatscraping.__path__))
 ROOT_PATH = os.path.abspath(os.path.join(MODULE_PATH, ".."))
 DEFAULT_CONFIG_FILE = os.path.join(MODULE_PATH, "default.conf")
 USER_CONFIG_FILE = os.path.abspath(os.path.expanduser("~/.scrapers.conf"))
-LOG_DIR = os.path.expanduser("~/.cache/scraperlogs/")
 TODAY = datetime.date.today()
 
-SECTIONS = {"*", "store", "mail", "logging"}
+# Minutes between runs of a scraper in daemon mode, unless configured with 'interval'
+DEFAULT_INTERVAL = 60
+
+SECTIONS = {"*", "store", "mail", "logging", "dedup", "http_cache", "rate_limit"}
 _SCRAPER = None
 
 ScraperResult = collections.namedtuple("ScraperResult", ["name", "narticles", "failed", "log"])
 
 
+def load_scraper_framework():
+    """Set up Django (needed by amcat.models) and import amcatscraping.scraper"""
+    importlib.import_module("amcatscraping.setup_django")
+    return importlib.import_module("amcatscraping.scraper")
+
+
 def get_scraper_class(scraper, relative_path):
+    """Import the module of a scraper class, only when it's about to be used"""
+    load_scraper_framework()
     scraper_module, scraper_class = relative_path.rsplit(".", 1)
 
     if not get_boolean(scraper["is_absolute_classpath"]):
@@ -89,20 +111,19 @@ def get_scraper_class(scraper, relative_path):
     return getattr(scraper_module, scraper_class)
 
 
-def run_single(config, args, scraper_config, scraper_class):
-    # Scraper config
-    articleset_id = int(scraper_config["articleset"])
-    project_id = int(scraper_config["project"])
-    username = scraper_config.get("username")
-    password = scraper_config.get("password")
-    scrape_comments = scraper_config.get("scrape_comments").lower() in ("y", "yes", "1", "true")
-
-    # Store config
+def get_store_config(config):
+    """Returns (url, username, password) of the AmCAT instance articles are saved to"""
     protocol = "https" if config.getboolean("store", "ssl") else "http"
     host_url = "%s://%s:%s" % (protocol, config.get("store", "host"), config.get("store", "port"))
-    host_username = config.get("store", "username")
-    host_password = config.get("store", "password")
+    return host_url, config.get("store", "username"), config.get("store", "password")
+
+
+def parse_date(s):
+    from iso8601.iso8601 import parse_date
+    return parse_date(s)
+
 
+def get_date_range(args):
     min_date = max_date = datetime.date.today()
 
     if args["--from"]:
@@ -119,6 +140,34 @@ def run_single(config, args, scraper_config, scraper_class):
         except ValueError:
             max_date = to_date(parse_date(args["--to"]))
 
+    return min_date, max_date
+
+
+def shard_dates(min_date, max_date, nshards):
+    """Split min_date..max_date into at most nshards contiguous (min_date, max_date) ranges"""
+    ndays = (max_date - min_date).days + 1
+    nshards = max(1, min(nshards, ndays))
+    for i in range(nshards):
+        yield (min_date + datetime.timedelta(days=i * ndays // nshards),
+               min_date + datetime.timedelta(days=(i + 1) * ndays // nshards - 1))
+
+
+def create_scraper(config, args, scraper_config, scraper_class):
+    from amcatscraping.httpcache import get_cache
+    from amcatscraping.ratelimit import get_limiter
+
+    # Scraper config
+    articleset_id = int(scraper_config["articleset"])
+    project_id = int(scraper_config["project"])
+    username = scraper_config.get("username")
+    password = scraper_config.get("password")
+    scrape_comments = scraper_config.get("scrape_comments").lower() in ("y", "yes", "1", "true")
+
+    # Store config
+    host_url, host_username, host_password = get_store_config(config)
+
+    min_date, max_date = get_date_range(args)
+
     opts = {
         "project_id": project_id,
         "articleset_id": articleset_id,
@@ -133,7 +182,14 @@ def run_single(config, args, scraper_config, scraper_class):
         "max_date": max_date,
         "dry_run": args["--dry-run"],
         "deduplicate_on_url": not args["--no-deduplicate-on-url"],
-        "batch_size": int(args.get("--batch-size") or 100)
+        "batch_size": int(args.get("--batch-size") or 100),
+        "workers": int(args.get("--workers") or scraper_config.get("workers") or 1),
+        "upload_queue": int(args.get("--upload-queue") or scraper_config.get("upload_queue") or 2),
+        "deduplicate_backend": config.get("dedup", "backend"),
+        "deduplicate_url": config.get("dedup", "url", fallback=None),
+        "resume": bool(args.get("--resume")),
+        "http_cache": get_cache(dict(config["http_cache"])),
+        "rate_limiter": get_limiter(dict(config["rate_limit"]))
     }
 
     raw_opts = dict(scraper_config)
@@ -141,20 +197,38 @@ def run_single(config, args, scraper_config, scraper_class):
         if opt in raw_opts:
             del raw_opts[opt]
 
-    for opt in ("username", "password", "articleset", "project", "class", "is_absolute_classpath"):
+    for opt in ("username", "password", "articleset", "project", "class", "is_absolute_classpath", "timeout", "interval"):
         if opt in raw_opts:
             del raw_opts[opt]
 
     opts["options"] = raw_opts
     scraper = scraper_class(**opts)
-    method = "run_update" if args["--update"] else "run"
     # allow debug access to scraper object
     global _SCRAPER
     _SCRAPER = scraper
+    return scraper
 
-    scraper.initialize()
+
+def run_single(config, args, scraper_config, scraper_class):
+    scraper = create_scraper(config, args, scraper_config, scraper_class)
+    return run_scraper(args, scraper)
+
+
+def run_scraper(args, scraper):
+    """Run a scraper, returning (articles, failed)"""
+    scraper_class = scraper.__class__
+    method = "run_update" if args["--update"] else "run"
+
+    if not scraper.has_pending_work():
+        log.info("Skipping {scraper_class.__name__}: all work completed in an earlier run".format(**locals()))
+        return [], False
+
+    failed = True
     try:
-        return list(getattr(scraper, method)()), False
+        scraper.initialize()
+        articles = list(getattr(scraper, method)())
+        failed = False
+        return articles, False
     except NotImplementedError:
         if args["--update"]:
             log.info("Updating not implemented for {scraper_class.__name__}".format(**locals()))
@@ -162,11 +236,28 @@ def run_single(config, args, scraper_config, scraper_class):
             log.exception("Running scraper {scraper_class.__name__} resulted in an exception:".format(**locals()))
     except Exception as e:
         log.exception("Running scraper {scraper_class.__name__} resulted in an exception:".format(**locals()))
+    finally:
+        scraper.teardown_session(failed=failed)
 
     return [], True
 
 
 def _run(config, args, scrapers):
+    scrapers = select_scrapers(config, scrapers)
+
+    if args.get("--shard-dates"):
+        jobs = list(get_sharded_jobs(args, scrapers, int(args["--shard-dates"])))
+        yield from _run_parallel(config, jobs, int(args.get("--parallel") or args["--shard-dates"]))
+    elif args.get("--parallel"):
+        jobs = [(label, scraper, args) for label, scraper in scrapers.items()]
+        yield from _run_parallel(config, jobs, int(args["--parallel"]))
+    else:
+        for label, scraper in scrapers.items():
+            yield run_label(config, args, label, scraper)
+
+
+def select_scrapers(config, scrapers):
+    """Return {label: scraper config} of the given labels, or of all scrapers if none are given"""
     all_scrapers = dict(get_scrapers(config))
     scrapers = {label: all_scrapers[label] for label in scrapers} or all_scrapers
 
@@ -181,42 +272,198 @@ def _run(config, args, scrapers):
         print("to list existing scrapers")
         sys.exit(1)
 
-    root_logger = logging.getLogger(amcatscraping.scraper.__name__)
+    return scrapers
+
+
+def get_sharded_jobs(args, scrapers, nshards):
+    """Yield (label, scraper, args) jobs, in which the date range of every date range scraper is
+    split into nshards. Other scrapers run as a single job."""
+    min_date, max_date = get_date_range(args)
     for label, scraper in scrapers.items():
-        log_buffer = io.StringIO()
-        log_handler = logging.StreamHandler(log_buffer)
-        root_logger.addHandler(log_handler)
+        scraper_class = get_scraper_class(scraper, scraper["class"])
+        if not issubclass(scraper_class, load_scraper_framework().DateRangeScraper):
+            yield label, scraper, args
+            continue
+
+        for shard_min_date, shard_max_date in shard_dates(min_date, max_date, nshards):
+            shard_args = dict(args, **{"--from": shard_min_date.isoformat(), "--to": shard_max_date.isoformat()})
+            yield "{}[{}..{}]".format(label, shard_min_date, shard_max_date), scraper, shard_args
+
+
+def _is_descendant(name, parent):
+    return parent == "" or name == parent or name.startswith(parent + ".")
+
+
+@contextlib.contextmanager
+def capture_logs(loggers):
+    """Capture everything logged to 'loggers' in a StringIO. Their descendants which don't
+    propagate (such as the loggers of tools.setup_logging) are captured as well, and every
+    record is captured once."""
+    targets = [logging.getLogger(name) for name in loggers]
+    for name, logger in list(logging.Logger.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and not logger.propagate and logger not in targets:
+            if any(_is_descendant(name, parent) for parent in loggers):
+                targets.append(logger)
+
+    log_buffer = io.StringIO()
+    log_handler = logging.StreamHandler(log_buffer)
+    for logger in targets:
+        logger.addHandler(log_handler)
+    try:
+        yield log_buffer
+    finally:
+        for logger in targets:
+            logger.removeHandler(log_handler)
 
+
+def run_label(config, args, label, scraper, loggers=("amcatscraping.scraper",)):
+    """Run a single configured scraper, capturing everything logged to 'loggers'"""
+    with capture_logs(loggers) as log_buffer:
         scraper_class = get_scraper_class(scraper, scraper["class"])
         articles, failed = run_single(config, args, scraper, scraper_class)
 
-        root_logger.removeHandler(log_handler)
-        yield ScraperResult(label, len(articles), failed, log_buffer.getvalue())
+    return ScraperResult(label, len(articles), failed, log_buffer.getvalue())
 
 
-def run(config, args, scrapers):
-    """Run scrapers and write logs afterwards"""
-    logs = collections.OrderedDict()
-    for label, narticles, failed, log in _run(config, args, scrapers):
-        logs[label] = (datetime.datetime.now(), narticles, failed, log)
+def _run_process(conn, config, args, label, scraper):
+    """Entry point of a scraper process started by _run_parallel"""
+    # Make sure atexit handlers (which quit browsers) run when we're terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
 
-    identifier = str(uuid.uuid4())
-    log_dir = os.path.join(LOG_DIR, TODAY.strftime("%Y-%m-%d"))
-    log_file = os.path.join(log_dir, identifier + ".json")
+    # Prefix log messages with the label, so output of concurrent scrapers can be told apart
+    formatter = logging.Formatter("[%(asctime)s %(levelname)8s] {}: %(message)s".format(label.replace("%", "%%")))
+    for logger in (logging.getLogger(), logging.getLogger("amcatscraping")):
+        for handler in logger.handlers:
+            handler.setFormatter(formatter)
 
+    # This process runs a single scraper, so capture everything it logs
     try:
-        os.makedirs(log_dir)
-    except OSError as exception:
-        if exception.errno != errno.EEXIST:
-            raise
+        result = run_label(config, args, label, scraper, loggers=("",))
+    except Exception:
+        result = ScraperResult(label, 0, True, traceback.format_exc())
+
+    conn.send(result)
+    conn.close()
+
+
+def get_timeout(args, scraper):
+    timeout = args.get("--timeout") or scraper.get("timeout")
+    return float(timeout) if timeout else None
+
+
+def _run_parallel(config, jobs, nprocesses):
+    """Run each (label, scraper, args) job in its own process, with at most nprocesses at the
+    same time. A scraper that crashes or exceeds its timeout is reported as failed."""
+    context = multiprocessing.get_context("fork")
+    todo = collections.deque(jobs)
+    running = {}  # connection -> (label, process, timeout, deadline)
+
+    while todo or running:
+        while todo and len(running) < nprocesses:
+            label, scraper, args = todo.popleft()
+            recv_conn, send_conn = context.Pipe(duplex=False)
+            process = context.Process(target=_run_process, name=label,
+                                      args=(send_conn, config, args, label, scraper))
+            process.start()
+            send_conn.close()
+
+            timeout = get_timeout(args, scraper)
+            deadline = time.monotonic() + timeout if timeout else None
+            running[recv_conn] = (label, process, timeout, deadline)
+            log.info("Started {label} (pid {process.pid})".format(**locals()))
+
+        deadlines = [deadline for _, _, _, deadline in running.values() if deadline is not None]
+        wait_timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+
+        for conn in multiprocessing.connection.wait(list(running), timeout=wait_timeout):
+            label, process, _, _ = running.pop(conn)
+            try:
+                result = conn.recv()
+            except EOFError:
+                process.join()
+                result = ScraperResult(label, 0, True, "Scraper process died (exit code: {})".format(process.exitcode))
+            process.join()
+            log.info("Finished {label}: {result.narticles} articles{failed}".format(
+                failed=" (failed)" if result.failed else "", **locals()))
+            yield result
+
+        now = time.monotonic()
+        for conn, (label, process, timeout, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                del running[conn]
+                log.error("Killing {label}: timeout exceeded".format(**locals()))
+                process.terminate()
+                process.join(30)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+                yield ScraperResult(label, 0, True, "Killed after exceeding timeout of {} seconds".format(timeout))
 
-    for label, (timestamp, narticles, failed, log) in logs.items():
-        json.dump({
-            "narticles": narticles, "log": log, "label": label,
-            "timestamp": int(timestamp.strftime("%s")),
-            "update": args["--update"], "uuid": identifier,
-            "failed": failed
-        }, open(log_file, "w"))
+
+def run(config, args, scrapers):
+    """Run scrapers, logging the result of each as soon as it finishes"""
+    run_log = RunLog()
+    for result in _run(config, args, scrapers):
+        write_log(run_log, args, result)
+
+
+def get_interval(scraper_config):
+    """Number of seconds between runs of a scraper in daemon mode"""
+    return 60 * float(scraper_config.get("interval") or DEFAULT_INTERVAL)
+
+
+def run_warm(config, args, label, scraper_config, instances):
+    """Run a scraper for the daemon, reusing its instance (sessions, API connection and feed
+    state) from the previous run if it succeeded"""
+    articles, failed = [], True
+    with capture_logs(("",)) as log_buffer:
+        try:
+            scraper = instances.get(label)
+            if scraper is None:
+                scraper_class = get_scraper_class(scraper_config, scraper_config["class"])
+                scraper = instances[label] = create_scraper(config, args, scraper_config, scraper_class)
+            else:
+                # Articles were uploaded since the urls were fetched from AmCAT
+                scraper.url_index.clear()
+                if isinstance(scraper, load_scraper_framework().DateRangeScraper):
+                    scraper.set_date_range(*get_date_range(args))
+            articles, failed = run_scraper(args, scraper)
+        except Exception:
+            log.exception("Could not run {label}".format(**locals()))
+        if failed:
+            instances.pop(label, None)
+    return ScraperResult(label, len(articles), failed, log_buffer.getvalue())
+
+
+def daemon(config, args, scrapers):
+    """Run scrapers repeatedly, each on its own interval, until interrupted"""
+    scrapers = select_scrapers(config, scrapers)
+    instances = {}
+    run_log = RunLog()
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: stop.set())
+
+    schedule = [(time.monotonic(), label) for label in sorted(scrapers)]
+    heapq.heapify(schedule)
+    while not stop.wait(max(0.0, schedule[0][0] - time.monotonic())):
+        start, label = heapq.heappop(schedule)
+        result = run_warm(config, args, label, scrapers[label], instances)
+        write_log(run_log, args, result)
+        log.info("Finished {label}: {result.narticles} articles{}".format(
+            " (failed)" if result.failed else "", **locals()))
+
+        # Don't try to catch up on runs missed while other scrapers were running
+        next_start = max(time.monotonic(), start + get_interval(scrapers[label]))
+        heapq.heappush(schedule, (next_start, label))
+
+    # Sessions were torn down after each run; pooled browsers are closed at exit
+    log.info("Stopping daemon")
+
+
+def write_log(run_log, args, result):
+    """Store the result of a single scraper run in the run log"""
+    return run_log.add(result.name, result.narticles, result.failed, result.log, update=args["--update"])
 
 
 def _bool_to_str(val):
@@ -225,12 +472,8 @@ def _bool_to_str(val):
     return "Yes" if val else "No"
 
 
-def get_logs(date):
-    log_dir = os.path.join(LOG_DIR, date.strftime("%Y-%m-%d"))
-    files = glob.glob(os.path.join(log_dir, "*.json"))
-    logs = map(json.load, map(open, files))
-    logs = sorted(logs, key=lambda l: (l['label'], l['timestamp']))
-
+def get_logs(run_log, min_date, max_date, labels=()):
+    logs = run_log.get_runs(min_date, max_date, labels)
     for log in logs:
         log["timestamp"] = datetime.datetime.fromtimestamp(log["timestamp"]).isoformat()
         log["update"] = _bool_to_str(log.get("update"))
@@ -242,15 +485,18 @@ def get_logs(date):
 def report(config, args):
     date = args.get('--date')
     date = TODAY if date is None else parse_date(date).date()
+    min_date = date - datetime.timedelta(days=int(args.get("--days") or 1) - 1)
 
     headers = ["label", "timestamp", "narticles", "update", "failed", "uuid"]
-    table_data = [[log[h] for h in headers] for log in get_logs(date)]
+    logs = get_logs(RunLog(), min_date, date, args.get("<scraper>") or ())
+    table_data = [[log[h] for h in headers] for log in logs]
 
     if table_data:
+        import tabulate
         print(tabulate.tabulate(table_data, headers=headers))
         print("\nUse 'scrape log <uuid>' to view the logs of a particular run.")
     else:
-        print("No logs found for {date}".format(date=date))
+        print("No logs found for {}".format(date if min_date == date else "{} to {}".format(min_date, date)))
         return
 
     if args["--email"]:
@@ -259,14 +505,21 @@ def report(config, args):
         print("OK.")
 
 def _log(config, args):
-    file = glob.glob(os.path.join(LOG_DIR, "*/{}.json".format(args["<uuid>"])))
+    run = RunLog().get_run(args["<uuid>"])
+    if run is None:
+        print("No log found for {}".format(args["<uuid>"]))
+    else:
+        print(run["log"].strip())
 
-    assert(len(file) <= 1)
 
-    try:
-        print(json.load(open(file[0]))["log"].strip())
-    except IndexError:
-        print("No log found for {}".format(args["<uuid>"]))
+def flush_spool(config, args):
+    """Upload batches left behind in the spool by failed or crashed runs"""
+    import amcatscraping.spool
+    from amcatclient.amcatclient import AmcatAPI
+
+    api = AmcatAPI(*get_store_config(config))
+    nbatches, narticles = amcatscraping.spool.flush(api.create_articles)
+    print("Uploaded {} articles in {} batch(es).".format(narticles, nbatches))
 
 
 def get_connection_config(config):
@@ -283,9 +536,21 @@ def get_connection_config(config):
         }
 
 
+def get_email_template():
+    import jinja2
+    env = jinja2.Environment(loader=jinja2.PackageLoader('amcatscraping', 'templates'))
+    return env.get_template('log_email.html')
+
+
 def _send_email(config, headers, table_data):
+    import tabulate
+    from email.utils import formatdate
+    # Configures Django, which sends the mail
+    importlib.import_module("amcatscraping.setup_django")
+    from django.core.mail import EmailMultiAlternatives, get_connection
+
     table_html = tabulate.tabulate(table_data, headers=headers)
-    html_content = EMAIL_TEMPLATE.render(table=table_html, today=TODAY)
+    html_content = get_email_template().render(table=table_html, today=TODAY)
     connection = get_connection(**get_connection_config(config))
 
     mail = EmailMultiAlternatives(
@@ -339,10 +604,14 @@ def main(config, args):
         return list_scrapers(config)
     if args["run"]:
         return run(config, args, args["<scraper>"])
+    if args["daemon"]:
+        return daemon(config, args, args["<scraper>"])
     if args["report"]:
         return report(config, args)
     if args["log"]:
         return _log(config, args)
+    if args["flush-spool"]:
+        return flush_spool(config, args)
 
 if __name__ == '__main__':
     from docopt import docopt
@@ -17,23 +17,24 @@
 # License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
 ###########################################################################
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from operator import itemgetter
 
+import collections
 import functools
 
-import redis
 import json
 import os
 import time
 import datetime
 import logging
 import itertools
-import atexit
 
-from typing import Iterable, List, Optional, Any, Union, Tuple, Set
+from typing import Iterable, List, Optional, Any, Union, Tuple, Callable
 
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException, \
+    WebDriverException
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from pyshadow.main import Shadow
@@ -41,7 +42,12 @@ from pyshadow.main import Shadow
 from amcat.models import PropertyMappingJSONEncoder
 from selenium.webdriver.remote.webelement import WebElement
 
+from .browserpool import POOL
+from .checkpoint import CheckpointMark, Checkpoints
+from .dedup import get_store
 from .httpsession import Session
+from .spool import Spool
+from .uploader import Uploader
 from .tools import to_date, memoize, open_json_cache
 from amcatclient.amcatclient import AmcatAPI, APIError
 from amcat.models import Article
@@ -57,6 +63,15 @@ def article_to_json(article: Article):
     return dict(static_fields, properties=dict(article.get_properties().items()))
 
 
+def _identity(x):
+    return x
+
+
+def hash_url(url: str) -> bytes:
+    """Compact representation of an url for duplicate detection"""
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+
+
 def to_trees(children: Iterable[Union[Article, "ArticleTree"]]) -> Iterable["ArticleTree"]:
     for child in children:
         if isinstance(child, Article):
@@ -83,7 +98,8 @@ class Scraper(object):
 
     def __init__(self, project_id: int, articleset_id: int, batch_size=100, dry_run=False,
                  api_host=None, api_user=None, api_password=None, scrape_comments=True,
-                 deduplicate_on_url=True, options=None, **kwargs):
+                 deduplicate_on_url=True, workers=1, upload_queue=2, resume=False, http_cache=None, rate_limiter=None,
+                 options=None, **kwargs):
         """
 
 
@@ -96,9 +112,17 @@ class Scraper(object):
         @param api_password:
         @param scrape_comments:
         @param deduplicate_on_url:
+        @param workers: number of threads scraping units concurrently (UnitScraper only)
+        @param upload_queue: number of batches waiting for upload while scraping continues.
+                             If 0, scraping pauses while a batch is saved.
+        @param resume: skip work recorded as completed in the checkpoints of an earlier run
+        @param http_cache: httpcache.ResponseCache for self.session, or None to always fetch pages
+        @param rate_limiter: ratelimit.RateLimiter for self.session
         @param kwargs:
         """
         self.batch_size = batch_size
+        self.workers = max(1, int(workers))
+        self.upload_queue = int(upload_queue)
         self.dry_run = dry_run
 
         self.project_id = project_id
@@ -118,9 +142,12 @@ class Scraper(object):
             self.api = self._api_auth()
 
         self.deduplicate_on_url = deduplicate_on_url
+        self.url_index = {}  # date -> set of url hashes
         self.duplicate_count = 0
         self.flush_flag = False
-        self.session = Session()
+        self.session = Session(cache=http_cache, limiter=rate_limiter)
+        self.resume = resume
+        self.checkpoint_marks = collections.deque()
 
     def initialize(self):
         self.setup_session()
@@ -131,31 +158,69 @@ class Scraper(object):
     def setup_session(self):
         pass
 
+    def teardown_session(self, failed=False):
+        """Called after the scraper ran, to release resources acquired in setup_session()
+
+        @param failed: whether the scraper raised an exception"""
+        pass
+
     def set_flush_flag(self):
         self.flush_flag = True
 
+    def get_checkpoints(self) -> Checkpoints:
+        return Checkpoints("{self.__class__.__name__}_{self.project_id}_{self.articleset_id}".format(self=self))
+
+    def has_pending_work(self) -> bool:
+        """Return False if resuming would not scrape anything, so we can skip setting up a session"""
+        return True
+
+    def mark_completed(self, key: str):
+        """Record that all articles of key have been scraped. It is committed to the checkpoints
+        once those articles are uploaded."""
+        self.checkpoint_marks.append(CheckpointMark(key))
+
+    def _with_checkpoint_marks(self, items: Iterable[Any]) -> Iterable[Any]:
+        """Put marks recorded with mark_completed() into the stream of items, right after the
+        item that was produced before them"""
+        for item in items:
+            while self.checkpoint_marks:
+                yield self.checkpoint_marks.popleft()
+            yield item
+        while self.checkpoint_marks:
+            yield self.checkpoint_marks.popleft()
+
+    def _commit_checkpoints(self, marks: collections.deque, nsaved: int):
+        """Commit the marks preceded by at most nsaved articles, i.e. all of whose articles are saved"""
+        keys = []
+        while marks and marks[0][0] <= nsaved:
+            keys.append(marks.popleft()[1].key)
+        if keys and not self.dry_run:
+            self.get_checkpoints().commit(keys)
+
     def scrape(self) -> Iterable[Union[Article, ArticleTree]]:
         """Scrape the target resource and return a sequence of article dicts"""
         raise NotImplementedError("scrape() not implemented.")
 
-    def upload(self, json_data):
-        for i in range(3):
+    def upload(self, json_data, tries=3):
+        for i in range(1, tries + 1):
             try:
                 return self.api.create_articles(self.project_id, self.articleset_id, json_data)
             except APIError:
-                logging.exception(f'[(i)/3] Error on uploading, {"giving up" if i == 3 else "retrying"}')
-        raise Exception("Uploading failed after retries, see log for error")
+                if i == tries:
+                    raise
+                log.exception(f"[{i}/{tries}] Error on uploading, retrying")
 
-    def _save(self, articles: List[Article]) -> Iterable[Article]:
+    def _save(self, articles: List[Article]) -> List[Article]:
         json_data = [article_to_json(a) for a in articles]
         new_articles = self.upload(json_data)
         for article, article_dict in zip(articles, new_articles):
             article.id = article_dict["id"]
-            yield article
+        return articles
 
     def save(self, articles: List[Article], tries=5, timeout=15) -> Iterable[Article]:
         """
-        Save given articles to the database in batches.
+        Save given articles to the database in batches. This is called from the uploader
+        thread, unless upload_queue is 0.
 
         :param articles: articles to be saved
         :param tries: number of API errors it should tolerate before giving up
@@ -193,27 +258,47 @@ class Scraper(object):
         """Space to do something with the unsaved articles that the scraper provided"""
         return articles
 
-    @functools.lru_cache()
-    def get_urls(self, date: datetime.date) -> Set[str]:
-        if self.no_api:
-            return set()
-
-        urls = {a["url"] for a in self.api.get_articles(
-            project=self.project_id,
-            articleset=self.articleset_id,
-            on_date=date.isoformat(),
-            columns=["url"],
-            page_size=9999
-        )}
-        logging.info(f"AmCAT contained {len(urls)} unique urls on that date")
-        return urls
+    def get_url_window(self, date: datetime.date) -> Tuple[datetime.date, datetime.date]:
+        """Returns the (first, last) date for which urls should be fetched when urls for 'date'
+        are needed. Scrapers covering a date range override this to fetch the whole range at once."""
+        return date, date
+
+    def prefetch_urls(self, min_date: datetime.date, max_date: datetime.date):
+        """Load (hashes of) urls of all articles in the articleset in [min_date, max_date]"""
+        ndays = (max_date - min_date).days + 1
+        index = {min_date + datetime.timedelta(days=n): set() for n in range(ndays)}
+
+        if not self.no_api:
+            articles = self.api.get_articles(
+                project=self.project_id,
+                articleset=self.articleset_id,
+                start_date=min_date.isoformat(),
+                end_date=(max_date + datetime.timedelta(days=1)).isoformat(),
+                columns=["url", "date"],
+                page_size=9999
+            )
+
+            for article in articles:
+                urls = index.get(datetime.date.fromisoformat(article["date"][:10]))
+                if urls is not None and article["url"]:
+                    urls.add(hash_url(article["url"]))
+
+        nurls = sum(map(len, index.values()))
+        log.info(f"AmCAT contained {nurls} unique urls between {min_date} and {max_date}")
+        self.url_index.update(index)
+
+    def has_url(self, url: str, date: datetime.date) -> bool:
+        """Returns whether an article with this url and date is already present in AmCAT"""
+        if date not in self.url_index:
+            self.prefetch_urls(*self.get_url_window(date))
+        return hash_url(url) in self.url_index[date]
 
     def deduplicate(self, articles: Iterable[Article]) -> Iterable[Article]:
         """Given a number of articles, return those not yet present in db based on a set of
         properties specified in the scraper's constructor."""
         if self.deduplicate_on_url:
             for article in articles:
-                if article.url not in self.get_urls(article.date.date()):
+                if not self.has_url(article.url, article.date.date()):
                     yield article
                 else:
                     self.duplicate_count += 1
@@ -232,27 +317,73 @@ class Scraper(object):
         for child in children:
             yield from self.process_tree(child, parent_hash=article.hash)
 
+    def _spool(self, spool: Optional[Spool], articles: List[Article]) -> Tuple[Optional[int], List[Article]]:
+        if spool is None:
+            return None, articles
+        json_data = [article_to_json(a) for a in articles]
+        return spool.append(self.project_id, self.articleset_id, json_data), articles
+
+    def _save_spooled(self, spool: Optional[Spool], batch: Tuple[Optional[int], List[Article]]) -> List[Article]:
+        batch_id, articles = batch
+        if spool is None:
+            return list(self.save(articles))
+
+        # Batch must be on disk before we attempt to upload it
+        spool.sync()
+        articles = list(self.save(articles))
+        spool.commit(batch_id)
+        return articles
+
     def _run(self) -> Iterable[Article]:
         log.info("Running SCRAPER {self.__class__.__name__} (batch size: {self.batch_size})".format(**locals()))
 
+        spool = None if self.dry_run else Spool(self.__class__.__name__, encoder=PropertyMappingJSONEncoder)
+        uploader = Uploader(functools.partial(self._save_spooled, spool), queue_size=self.upload_queue)
         save_queue = []
-        for article_tree in self.scrape():
-            # Scrape can yield articles or trees
-            if not isinstance(article_tree, ArticleTree):
-                article_tree = next(iter(to_trees((article_tree,))))
-
-            # Flatten tree, add to save queue
-            save_queue.extend(self.process_tree(article_tree, article_tree.article.parent_hash))
+        marks = collections.deque()  # (number of articles queued before it, mark)
+        nqueued = nsaved = 0
+        try:
+            try:
+                for article_tree in self.scrape():
+                    if isinstance(article_tree, CheckpointMark):
+                        marks.append((nqueued, article_tree))
+                        continue
 
-            # Save if we've collected enough articles or if we're forced to flush
-            if len(save_queue) >= self.batch_size or self.flush_flag:
-                yield from self.save(save_queue)
-                save_queue.clear()
-                self.flush_flag = False
+                    # Scrape can yield articles or trees
+                    if not isinstance(article_tree, ArticleTree):
+                        article_tree = next(iter(to_trees((article_tree,))))
+
+                    # Flatten tree, add to save queue
+                    articles = list(self.process_tree(article_tree, article_tree.article.parent_hash))
+                    save_queue.extend(articles)
+                    nqueued += len(articles)
+
+                    # Save if we've collected enough articles or if we're forced to flush
+                    if len(save_queue) >= self.batch_size or self.flush_flag:
+                        uploader.put(self._spool(spool, save_queue))
+                        save_queue = []
+                        self.flush_flag = False
+
+                    for article in uploader.completed():
+                        nsaved += 1
+                        yield article
+                    self._commit_checkpoints(marks, nsaved)
+
+                # Save all others
+                if save_queue:
+                    uploader.put(self._spool(spool, save_queue))
+            except BaseException:
+                uploader.abort()
+                raise
 
-        # Save all others
-        if save_queue:
-            yield from self.save(save_queue)
+            # Wait for the uploader to finish, so all articles have an id when run() returns
+            for article in uploader.close():
+                nsaved += 1
+                yield article
+            self._commit_checkpoints(marks, nsaved)
+        finally:
+            if spool is not None:
+                spool.close()
 
     def run(self) -> List[Article]:
         articles = list(self._run())
@@ -268,6 +399,9 @@ class UnitScraper(Scraper):
         for unit in self.get_units():
             yield self.scrape_unit(unit)
 
+    If workers > 1, scrape_unit() is called from a thread pool while get_units() keeps
+    running in the calling thread. Only enable this for scrapers whose scrape_unit() is
+    thread-safe, i.e. it does not touch a shared browser.
     """
     def get_units(self) -> Iterable[Any]:
         return []
@@ -275,21 +409,51 @@ class UnitScraper(Scraper):
     def scrape_unit(self, unit) -> Optional[Article]:
         return None
 
-    def scrape(self) -> Iterable[Union[Article, ArticleTree]]:
-        for unit in self.get_units():
+    def _get_new_units(self) -> Iterable[Any]:
+        for unit in self._with_checkpoint_marks(self.get_units()):
+            if isinstance(unit, CheckpointMark):
+                yield unit
+                continue
+
             if self.deduplicate_on_url:
                 try:
                     url, date = self.get_url_and_date_from_unit(unit)
                 except NotImplementedError:
                     pass
                 else:
-                    if url in self.get_urls(date):
+                    if self.has_url(url, to_date(date)):
                         # Duplicate detected
                         self.duplicate_count += 1
                         continue
+            yield unit
+
+    def _scrape_units(self, units: Iterable[Any]) -> Iterable[Tuple[Any, Callable[[], Any]]]:
+        """Yield (unit, result) pairs in submission order, where result() returns the scraped
+        unit or raises whatever scrape_unit() raised. With more than one worker, scrape_unit()
+        runs in a thread pool which is kept at most 2 * workers units ahead of the consumer."""
+        if self.workers == 1:
+            for unit in units:
+                if isinstance(unit, CheckpointMark):
+                    yield unit, functools.partial(_identity, unit)
+                else:
+                    yield unit, functools.partial(self.scrape_unit, unit)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = collections.deque()
+            for unit in units:
+                if isinstance(unit, CheckpointMark):
+                    pending.append((unit, functools.partial(_identity, unit)))
+                else:
+                    pending.append((unit, pool.submit(self.scrape_unit, unit).result))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft()
+            yield from pending
 
+    def scrape(self) -> Iterable[Union[Article, ArticleTree]]:
+        for unit, result in self._scrape_units(self._get_new_units()):
             try:
-                yield self.scrape_unit(unit)
+                yield result()
             except SkipArticle as e:
                 logging.warning(f"Skipping article {unit}: {e}")
 
@@ -300,16 +464,30 @@ class UnitScraper(Scraper):
 class DeduplicatingUnitScraper(UnitScraper):
     """
     Deduplicate article based on arbitrary properties on a unit. This will not query the AmCAT
-    database to find duplicates, but uses a local cache (Redis) instead.
+    database to find duplicates, but uses a local store (see amcatscraping.dedup) instead.
+
+    Units are checked against the store in windows of deduplicate_window units, which means
+    get_deduplicate_units() runs up to that many units ahead of scrape_unit(). Scrapers whose
+    units are only valid while the browser shows a particular page should lower it.
     """
-    def __init__(self, *args, **kwargs):
+    deduplicate_window = 100
+
+    def __init__(self, *args, deduplicate_backend="redis", deduplicate_url=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.cache = redis.from_url("redis://127.0.0.1:6379/1")
+        self.dedup_store = get_store(deduplicate_backend, deduplicate_url)
 
     @functools.lru_cache()
     def _get_redis_key(self):
         return "amcatscraping_{self.__class__.__name__}_{self.project_id}_{self.articleset_id}".format(self=self)
 
+    def is_cached(self, unit: Any) -> bool:
+        return self.are_cached([unit])[0]
+
+    def are_cached(self, units: List[Any]) -> List[bool]:
+        """Check whether units were scraped before, using a single lookup"""
+        keys = [self._get_deduplicate_key_from_unit(unit) for unit in units]
+        return self.dedup_store.contains(self._get_redis_key(), keys)
+
     def _hash_key(self, key: str) -> bytes:
         bytes_key = key.encode("utf-8")
         if len(bytes_key) > 16:
@@ -331,19 +509,47 @@ class DeduplicatingUnitScraper(UnitScraper):
     def get_deduplicate_units(self):
         raise NotImplementedError()
 
+    def _get_deduplicate_windows(self) -> Iterable[Tuple[List[Any], bool]]:
+        """Yield (units, flush) windows of at most deduplicate_window units. A window ends early
+        when get_deduplicate_units() sets the flush flag, in which case flush is True."""
+        window = []
+        for unit in self._with_checkpoint_marks(self.get_deduplicate_units()):
+            window.append(unit)
+            if self.flush_flag or len(window) >= self.deduplicate_window:
+                flush, self.flush_flag = self.flush_flag, False
+                yield window, flush
+                window = []
+
+        if window:
+            yield window, False
+
     def get_units(self):
-        for unit in self.get_deduplicate_units():
-            key = self._get_deduplicate_key_from_unit(unit)
-            if not self.cache.sismember(self._get_redis_key(), key):
+        redis_key = self._get_redis_key()
+        for window, flush in self._get_deduplicate_windows():
+            keys = [self._get_deduplicate_key_from_unit(unit) for unit in window if not isinstance(unit, CheckpointMark)]
+            cached = iter(self.dedup_store.contains(redis_key, keys))
+            window = [unit for unit in window if isinstance(unit, CheckpointMark) or not next(cached)]
+            nunits = sum(1 for unit in window if not isinstance(unit, CheckpointMark))
+            self.duplicate_count += len(keys) - nunits
+
+            i = 0
+            for unit in window:
+                if not isinstance(unit, CheckpointMark):
+                    # Restore flush flag just before the last unit, like get_deduplicate_units() did
+                    i += 1
+                    if flush and i == nunits:
+                        self.set_flush_flag()
                 yield unit
-            else:
-                self.duplicate_count += 1
+
+            if flush and not nunits:
+                self.set_flush_flag()
 
     def save(self, *args, **kwargs):
-        for article in super(DeduplicatingUnitScraper, self).save(*args, **kwargs):
-            if not self.dry_run:
-                self.cache.sadd(self._get_redis_key(), self._get_deduplicate_key_from_article(article))
-            yield article
+        articles = list(super(DeduplicatingUnitScraper, self).save(*args, **kwargs))
+        if articles and not self.dry_run:
+            keys = [self._get_deduplicate_key_from_article(article) for article in articles]
+            self.dedup_store.add(self._get_redis_key(), keys)
+        return articles
 
 
 class DateRangeScraper(Scraper):
@@ -360,14 +566,58 @@ class DateRangeScraper(Scraper):
         assert(not isinstance(min_date, datetime.datetime))
         assert(not isinstance(max_date, datetime.datetime))
 
+        self.set_date_range(min_date, max_date)
+
+    def set_date_range(self, min_date, max_date):
+        """Change the period to scrape, for example when an instance is reused by 'scrape.py daemon'"""
         self.min_date = min_date
         self.max_date = max_date
         self.dates = tuple(self._get_dates(self.min_date, self.max_date))
+        self.url_index = {}
 
     def _get_dates(self, min_date, max_date):
         for n in range((max_date - min_date).days + 1):
             yield min_date + datetime.timedelta(days=n)
 
+    def _get_work(self, editions=None) -> List[Any]:
+        if editions is None:
+            return list(self.dates)
+        return [(date, edition) for date in self.dates for edition in editions]
+
+    def _get_work_key(self, item) -> str:
+        if isinstance(item, tuple):
+            date, edition = item
+            return "{}/{}".format(date.isoformat(), edition)
+        return item.isoformat()
+
+    def iter_dates(self, editions=None) -> Iterable[Any]:
+        """
+        Yield the dates to scrape, or (date, edition) pairs if editions are given. Subclasses
+        should iterate over these instead of self.dates: when resuming, work completed in an
+        earlier run is skipped, and a date is marked as completed as soon as the next one is
+        requested.
+        """
+        completed = self.get_checkpoints().completed() if self.resume else set()
+        for item in self._get_work(editions):
+            key = self._get_work_key(item)
+            if key in completed:
+                log.info("Skipping {key}: completed in an earlier run".format(**locals()))
+                continue
+            yield item
+            self.mark_completed(key)
+
+    def has_pending_work(self):
+        if not self.resume:
+            return True
+        completed = self.get_checkpoints().completed()
+        work = self._get_work(getattr(self, "editions", None))
+        return any(self._get_work_key(item) not in completed for item in work)
+
+    def get_url_window(self, date):
+        if self.min_date <= date <= self.max_date:
+            return self.min_date, self.max_date
+        return super(DateRangeScraper, self).get_url_window(date)
+
     def postprocess(self, articles):
         articles = list(super(DateRangeScraper, self).postprocess(articles))
 
@@ -384,6 +634,31 @@ class DateRangeScraper(Scraper):
 CACHE_DIR = os.path.expanduser("~/.cache")
 
 
+class FeedMixin(object):
+    """
+    Polls RSS / Atom feeds incrementally. The ETag and Last-Modified headers of a feed are
+    remembered, so an unchanged feed is not downloaded again, and only entries which were not in
+    the previous version of the feed are returned. This state lives as long as the scraper
+    instance, which 'scrape.py daemon' keeps between runs.
+    """
+    def get_feed_entries(self, url: str) -> List[Any]:
+        import feedparser
+
+        feed_state = self.__dict__.setdefault("_feed_state", {})
+        etag, modified, seen = feed_state.get(url, (None, None, frozenset()))
+        feed = feedparser.parse(url, etag=etag, modified=modified)
+        if feed.get("status") == 304:
+            log.info("Feed {url} did not change".format(**locals()))
+            return []
+
+        entries = feed["entries"]
+        ids = [entry.get("id") or entry.get("link") for entry in entries]
+        feed_state[url] = (feed.get("etag"), feed.get("modified"), frozenset(ids))
+        new_entries = [entry for id, entry in zip(ids, entries) if id not in seen]
+        log.info("Feed {url} has {} new entries".format(len(new_entries), **locals()))
+        return new_entries
+
+
 class DateNotFoundError(Exception):
     pass
 
@@ -559,18 +834,73 @@ class BinarySearchDateRangeScraper(DateRangeScraper, BinarySearchScraper):
         raise NotImplementedError("scrape_unit() not implemented.")
 
 
-def quit_browser(browser):
-    try:
-        browser.quit()
-    except:
-        pass
-
-
 class NotVisible(Exception):
     pass
 
 
+# Resolves with the (visible) elements matching a selector as soon as they appear, or with an
+# empty list after the timeout. Arguments: selector, is_xpath, visible, timeout_ms, root.
+WAIT_FOR_ELEMENTS_SCRIPT = """
+var selector = arguments[0], isXPath = arguments[1], visible = arguments[2], timeout = arguments[3];
+var root = arguments[4] || document, done = arguments[arguments.length - 1];
+
+function isVisible(e) {
+    var style = window.getComputedStyle(e);
+    return e.getClientRects().length > 0 && style.visibility !== "hidden" && style.display !== "none";
+}
+
+function find() {
+    var found = [];
+    if (isXPath) {
+        var result = document.evaluate(selector, root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (var i = 0; i < result.snapshotLength; i++) found.push(result.snapshotItem(i));
+    } else {
+        found = Array.prototype.slice.call(root.querySelectorAll(selector));
+    }
+    return visible ? found.filter(isVisible) : found;
+}
+
+var elements = find();
+if (elements.length) return done(elements);
+
+var observer = new MutationObserver(function() {
+    var elements = find();
+    if (elements.length) { finish(elements); }
+});
+var timer = setTimeout(function() { finish([]); }, timeout);
+function finish(elements) { observer.disconnect(); clearTimeout(timer); done(elements); }
+observer.observe(root === document ? document.documentElement : root,
+                 {childList: true, subtree: true, attributes: visible, characterData: false});
+"""
+
+# Resolves with true once the document is loaded and no resources were requested for idle_ms,
+# or false after the timeout. Arguments: idle_ms, timeout_ms.
+WAIT_FOR_NETWORK_IDLE_SCRIPT = """
+var idle = arguments[0], timeout = arguments[1], done = arguments[arguments.length - 1];
+var start = Date.now(), count = -1, since = Date.now();
+
+(function check() {
+    var n = performance.getEntriesByType("resource").length;
+    if (n !== count || document.readyState !== "complete") { count = n; since = Date.now(); }
+    if (Date.now() - since >= idle) return done(true);
+    if (Date.now() - start >= timeout) return done(false);
+    setTimeout(check, 50);
+})();
+"""
+
+
+def _poll_intervals(initial=0.05, maximum=1.0):
+    """Adaptive polling: check quickly at first, then back off"""
+    interval = initial
+    while True:
+        yield interval
+        interval = min(maximum, interval * 2)
+
+
 class SeleniumMixin(object):
+    """Scrape using a browser leased from the browser pool. Set the scraper option
+    'browser_max_pages' to control how many pages a browser loads before it is replaced."""
+    browser_lease = None  # browserpool.BrowserLease while a browser is leased
 
     def get_browser(self):
         fp = webdriver.FirefoxProfile()
@@ -578,15 +908,36 @@ class SeleniumMixin(object):
             fp.set_preference(k, v)
         return webdriver.Firefox(firefox_profile=fp)
 
+    def get_browser_key(self) -> Tuple:
+        """Browsers are only shared between scrapers with the same key"""
+        password = getattr(self, "password", None)
+        password_hash = password and hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return self.__class__.__name__, getattr(self, "username", None), password_hash
+
+    def _get_browser_max_pages(self) -> Optional[int]:
+        max_pages = self.options.get("browser_max_pages")
+        return int(max_pages) if max_pages else None
+
     def setup_session(self):
-        self.browser = self.get_browser()
+        self.browser_lease = POOL.lease(self.get_browser_key(), self.get_browser, self._get_browser_max_pages())
+        self.browser = self.browser_lease.browser
         self.shadow = Shadow(self.browser)
         self.shadow.set_implicit_wait(10)
-        atexit.register(quit_browser, self.browser)
 
         super(SeleniumMixin, self).setup_session()
 
+    def teardown_session(self, failed=False):
+        super(SeleniumMixin, self).teardown_session(failed=failed)
+        self.log_wait_stats()
+        if self.browser_lease is not None:
+            POOL.release(self.browser_lease, reuse=not failed, max_pages=self._get_browser_max_pages())
+            self.browser_lease = None
+        # The browser may now be leased to another scraper, or quit
+        self.browser = self.shadow = None
+
     def browser_get(self, url):
+        if self.browser_lease is not None:
+            self.browser_lease.pages += 1
         self.browser.get(url)
         self.browser.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
@@ -602,28 +953,123 @@ class SeleniumMixin(object):
         """
         Find the specified elements, wait until at least one (visible) element is found.
         Raises NoSuchElementException or NotVisible if no (visible) element is found within the timeout.
+
+        CSS and XPath selectors are waited for in the page itself, which returns as soon as the
+        DOM changes to contain the elements. Otherwise, or if that fails (for example because the
+        page navigated away), we fall back to polling.
         """
-        start = datetime.datetime.now()
+        start = time.monotonic()
+        try:
+            elements = None
+            if by in (By.CSS_SELECTOR, By.XPATH) and (on is None or on is self.browser or isinstance(on, WebElement)):
+                elements = self._wait_in_page(selector, timeout, visible, by, on)
+            if elements is None:
+                remaining = max(0, timeout - (time.monotonic() - start))
+                elements = self._wait_polling(selector, remaining, visible, by, on)
+            return elements
+        finally:
+            self._record_wait(selector, time.monotonic() - start)
+
+    def _wait_in_page(self, selector, timeout, visible, by, on) -> Optional[List[WebElement]]:
+        root = on if isinstance(on, WebElement) else None
+        self.browser.set_script_timeout(timeout + 5)
+        try:
+            elements = self.browser.execute_async_script(
+                WAIT_FOR_ELEMENTS_SCRIPT, selector, by == By.XPATH, visible, int(timeout * 1000), root)
+        except WebDriverException:
+            log.debug("In-page wait for {selector} failed, polling instead".format(**locals()), exc_info=True)
+            return None
+
+        if elements:
+            return elements
+
+        # Timed out: raise the same errors as the polling version
+        elements = (on or self.browser).find_elements(by, selector)
+        if not elements:
+            raise NoSuchElementException(f"Could not find element(s): {selector}")
+        if visible:
+            elements = [e for e in elements if e.is_displayed()]
+            if not elements:
+                raise NotVisible(f"Element(s) present, but not visible: {selector}")
+        return elements
+
+    def _wait_polling(self, selector, timeout, visible, by, on) -> List[WebElement]:
         on = on or self.browser
-        while True:
-            seconds_forgone = (datetime.datetime.now() - start).total_seconds()
+        start = time.monotonic()
+        for interval in _poll_intervals():
+            seconds_forgone = time.monotonic() - start
             elements = on.find_elements(by, selector)
             if not elements:
                 if seconds_forgone > timeout:
                     raise NoSuchElementException(f"Could not find element(s): {selector}")
-                else:
-                    time.sleep(.5)
-                    continue
+                time.sleep(interval)
+                continue
             if visible:
                 elements = [e for e in elements if e.is_displayed()]
             if not elements:
                 if seconds_forgone > timeout:
                     raise NotVisible(f"Element(s) present, but not visible: {selector}")
-                else:
-                    time.sleep(.5)
-                    continue
+                time.sleep(interval)
+                continue
             return elements
 
+    def wait_until(self, condition: Callable[[], Any], timeout=60, description=None) -> Any:
+        """
+        Wait until condition() returns a true value, and return it. Polls quickly at first and
+        backs off to once a second. Raises TimeoutException when the timeout expires.
+        """
+        start = time.monotonic()
+        try:
+            for interval in _poll_intervals():
+                result = condition()
+                if result:
+                    return result
+                if time.monotonic() - start > timeout:
+                    raise TimeoutException("Condition not met within {} seconds: {}".format(timeout, description or condition))
+                time.sleep(interval)
+        finally:
+            self._record_wait(description or "wait_until", time.monotonic() - start)
+
+    def wait_gone(self, selector, timeout=60, by=By.CSS_SELECTOR):
+        """Wait until no element matching selector is visible anymore"""
+        def gone():
+            try:
+                return not any(e.is_displayed() for e in self.browser.find_elements(by, selector))
+            except StaleElementReferenceException:
+                return False
+        self.wait_until(gone, timeout=timeout, description="gone: {}".format(selector))
+
+    def wait_network_idle(self, idle=0.5, timeout=30) -> bool:
+        """
+        Wait until the page finished loading and did not start loading any resources for
+        `idle` seconds. Returns False (instead of raising) if that did not happen within the
+        timeout, as some pages keep polling forever.
+        """
+        start = time.monotonic()
+        self.browser.set_script_timeout(timeout + 5)
+        try:
+            return self.browser.execute_async_script(WAIT_FOR_NETWORK_IDLE_SCRIPT, int(idle * 1000), int(timeout * 1000))
+        except WebDriverException:
+            log.debug("Waiting for network idle failed", exc_info=True)
+            return False
+        finally:
+            self._record_wait("network idle", time.monotonic() - start)
+
+    def _record_wait(self, description, seconds):
+        if not hasattr(self, "wait_stats"):
+            self.wait_stats = collections.Counter()
+            self.wait_counts = collections.Counter()
+        self.wait_stats[description] += seconds
+        self.wait_counts[description] += 1
+
+    def log_wait_stats(self, n=10):
+        """Log the waits this scraper spent most time on"""
+        stats = getattr(self, "wait_stats", collections.Counter())
+        log.info("{} spent {:.1f}s waiting for the browser".format(self.__class__.__name__, sum(stats.values())))
+        for description, seconds in stats.most_common(n):
+            count = self.wait_counts[description]
+            log.info("  {seconds:7.1f}s in {count:5d} waits for {description}".format(**locals()))
+
     def get_browser_preferences(self):
         return ()
 
@@ -639,9 +1085,18 @@ class LoginMixin(object):
     def setup_session(self):
         super(LoginMixin, self).setup_session()
 
+        # A browser from the pool might still be logged in by a previous scraper
+        lease = getattr(self, "browser_lease", None)
+        if lease is not None and lease.logged_in:
+            log.info("Reusing logged in browser session")
+            return
+
         if not self.login(self.username, self.password):
             raise ValueError("Login routine returned False. Are your credentials correct?")
 
+        if lease is not None:
+            lease.logged_in = True
+
     def login(self, username, password):
         raise NotImplementedError("login() not implemented.")
 
@@ -654,13 +1109,12 @@ class SeleniumLoginMixin(LoginMixin):
 
     def login(self, username, password):
         self.browser_get(self.login_url)
-        time.sleep(1)
         self.wait(self.login_username_field).send_keys(username)
         self.wait(self.login_username_field).send_keys(Keys.ENTER)
         self.wait(self.login_password_field).send_keys(password)
         self.wait(self.login_password_field).send_keys(Keys.ENTER)
 
-        time.sleep(2)
+        self.wait_network_idle()
 
         try:
             self.wait(self.login_error_selector, timeout=3)
@@ -70,7 +70,7 @@ class GeenstijlScraper(DeduplicatingUnitScraper, DateRangeScraper):
         return article.url
 
     def get_deduplicate_units(self):
-        for date in self.dates:
+        for date in self.iter_dates():
             day_string = date.strftime("%d-%m-%y")
             
             if day_string not in self.articles:
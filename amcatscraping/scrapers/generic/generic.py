@@ -21,19 +21,19 @@ import http.cookies
 import locale
 import logging
 import re
-import time
 
 from urllib.parse import urljoin, urlparse
 
 import dateutil
-import feedparser
 import iso8601
 import lxml
 import lxml.html
+import readability
+import requests
 
 from amcat.models import Article
-from amcatscraping.scraper import DeduplicatingUnitScraper, SeleniumMixin, SeleniumLoginMixin
-from amcatscraping.tools import html2text
+from amcatscraping.scraper import DeduplicatingUnitScraper, FeedMixin, LoginMixin, SeleniumMixin, SeleniumLoginMixin
+from amcatscraping.tools import html2text, get_boolean
 
 log = logging.getLogger(__name__)
 
@@ -53,11 +53,21 @@ def dutch_strptime(date, pattern):
          locale.setlocale(locale.LC_ALL, loc)
    
 class GenericScraper(SeleniumMixin, DeduplicatingUnitScraper):
+    """
+    Scrapes all articles linked from index_url, extracting their text with Firefox' reader mode.
+
+    If use_http is set (or the option 'http_fast_path' is enabled), pages are fetched over plain
+    HTTP and the text is extracted with readability instead. The browser is then only started
+    for pages whose static HTML yields less than min_text_length characters of text. Scrapers
+    which log in don't use the fast path, as the session is kept in the browser.
+    """
     index_url = None
     article_url_re = None
     article_url_cssselector = "a"
     has_ccm_cookies = False
     cookies = None
+    use_http = False
+    min_text_length = 200
 
     # Cookies know to prevent banners
     default_cookies = {
@@ -74,22 +84,39 @@ class GenericScraper(SeleniumMixin, DeduplicatingUnitScraper):
         self.index_url = self.options.get("index_url", self.index_url)
         self.article_url_re = re.compile(self.options.get("article_url", self.article_url_re))
         self.publisher = self.options.get("publisher", get_publisher(self.index_url))
+        self.use_http = get_boolean(self.options.get("http_fast_path", str(self.use_http)))
+        if self.use_http and isinstance(self, LoginMixin):
+            log.warning("{} logs in with a browser, ignoring http_fast_path".format(self.__class__.__name__))
+            self.use_http = False
         self.now = datetime.datetime.now()
+        self.browser = None
+
+    def get_cookies(self):
+        cookies = dict(self.default_cookies)
+        if self.cookies:
+            for name, morsel in http.cookies.BaseCookie(self.cookies).items():
+                cookies[name] = morsel.value
+        return cookies
 
     def setup_session(self):
+        if self.use_http:
+            # The browser is started when we first need it, see setup_browser()
+            self.session.cookies.update(self.get_cookies())
+        else:
+            self.setup_browser()
+
+    def setup_browser(self):
         super().setup_session()
 
         self.browser.get(self.index_url)
         self.wait("html")
 
-        if self.cookies:
-            for name, morsel in http.cookies.BaseCookie(self.cookies).items():
-                self.browser.add_cookie({'name': name, 'value': morsel.value})
-
-        for name, value in self.default_cookies.items():
+        for name, value in self.get_cookies().items():
             self.browser.add_cookie({'name': name, 'value': value})
 
     def get_raw_html(self, url, wait_for="html"):
+        if self.browser is None:
+            self.setup_browser()
         self.browser.get(url)
         self.wait(wait_for)
         return self.wait("html").get_attribute("outerHTML")
@@ -107,9 +134,17 @@ class GenericScraper(SeleniumMixin, DeduplicatingUnitScraper):
         return article.url
 
     def get_deduplicate_units(self):
-        index = self.get_html(self.index_url)
+        units = []
+        if self.use_http:
+            index = self.session.get_html(self.index_url)
+            units = index.cssselect(self.article_url_cssselector)
+            if not units:
+                log.info("No links found in static HTML of {}, using browser".format(self.index_url))
+
+        if not units:
+            index = self.get_html(self.index_url)
+            units = index.cssselect(self.article_url_cssselector)
 
-        units = index.cssselect(self.article_url_cssselector)
         n_units = len(units)
 
         seen = set()
@@ -122,6 +157,37 @@ class GenericScraper(SeleniumMixin, DeduplicatingUnitScraper):
                 seen.add(absolute_url)
 
     def scrape_unit(self, url):
+        if self.use_http:
+            try:
+                article = self.scrape_unit_http(url)
+            except requests.RequestException as e:
+                log.info("Could not fetch {} over HTTP ({}), using browser".format(url, e))
+            else:
+                if article is not None:
+                    return article
+                log.info("Too little text in static HTML of {}, using browser".format(url))
+        return self.scrape_unit_browser(url)
+
+    def scrape_unit_http(self, url):
+        """Scrape url without a browser. Returns None if the page yields too little text."""
+        doc = lxml.html.fromstring(self.session.get_content(url), base_url=url)
+        # Readability modifies the tree it is given, so get the date first
+        date = self.get_date_or_now(doc)
+        document = readability.Document(doc, url=url)
+
+        content = lxml.html.fromstring(document.summary(html_partial=True))
+        for tag in REMOVE_TAGS:
+            for element in content.cssselect(tag):
+                element.getparent().remove(element)
+        text = html2text(lxml.html.tostring(content).decode())
+
+        if len(text.strip()) < self.min_text_length:
+            return None
+
+        title = document.short_title().strip()
+        return Article(date=date, title=title, text=text, url=url)
+
+    def scrape_unit_browser(self, url):
         reader_url = "about:reader?url={}".format(url)
         doc = self.get_html(reader_url, wait_for="div.content p")
 
@@ -138,17 +204,10 @@ class GenericScraper(SeleniumMixin, DeduplicatingUnitScraper):
         if self.__class__.get_date is not GenericScraper.get_date:
             # Get contents of un-firefox-read-ed article
             self.wait(".reader-toolbar .close-button").click()
-            time.sleep(0.3)
+            self.wait_gone(".reader-toolbar", timeout=10)
             doc_html = self.wait("html").get_attribute("outerHTML")
             doc = lxml.html.fromstring(doc_html, base_url=url)
-
-            try:
-                date = self.get_date(doc)
-            except NotImplementedError:
-                date = self.now
-            except Exception as e:
-                log.warning("get_date() failed for {} with: {}".format(url, e))
-                date = self.now
+            date = self.get_date_or_now(doc)
         else:
             date = self.now
 
@@ -156,17 +215,25 @@ class GenericScraper(SeleniumMixin, DeduplicatingUnitScraper):
 
         return article
 
-class GenericRSSScraper(GenericScraper):
+    def get_date_or_now(self, doc):
+        try:
+            return self.get_date(doc)
+        except NotImplementedError:
+            return self.now
+        except Exception as e:
+            log.warning("get_date() failed for {} with: {}".format(doc.base_url, e))
+            return self.now
+
+class GenericRSSScraper(FeedMixin, GenericScraper):
     article_url_re = ".+"
+    use_http = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.url_date_cache = {}
 
     def get_deduplicate_units(self):
-        feed = feedparser.parse(self.index_url)
-
-        for entry in feed['entries']:
+        for entry in self.get_feed_entries(self.index_url):
             url = entry["links"][0]["href"]
             date = dateutil.parser.parse(entry['published'])
             self.url_date_cache[url] = date
@@ -291,6 +358,7 @@ class Telegraaf(SeleniumLoginMixin, GenericScraper):
         return super().login(username, password)
 
 class NOS(GenericScraper):
+    use_http = True
     index_url = "https://www.nos.nl/"
     article_url_re = "/artikel/"
 
@@ -328,6 +396,7 @@ class RTLNieuws(GenericScraper):
         self.wait(".accept-button").click()
 
 class EenVandaag(GenericScraper):
+    use_http = True
     index_url = "https://eenvandaag.avrotros.nl/"
     article_url_re = "/item/"
 
@@ -337,6 +406,7 @@ class EenVandaag(GenericScraper):
         return date
 
 class SocialeVraagstukken(GenericScraper):
+    use_http = True
     index_url = "https://www.socialevraagstukken.nl/"
     article_url_cssselector = "article h2 a"
     article_url_re = ".+"
@@ -346,6 +416,7 @@ class SocialeVraagstukken(GenericScraper):
         return iso8601.iso8601.parse_date(date, default_timezone=None)
 
 class Zembla(GenericScraper):
+    use_http = True
     index_url = "https://zembla.bnnvara.nl/nieuws"
     article_url_re = "/nieuws/[\w-]+"
     has_ccm_cookies = True
@@ -372,6 +443,7 @@ class Kassa(GenericScraper):
         return dutch_strptime(date, "%A %d %B %Y")
 
 class PW(GenericScraper):
+    use_http = True
     index_url = "https://www.pw.nl/nieuws/alle-nieuws"
     article_url_re = "/nieuws/\d{4}/[\w-]+"
 
@@ -411,6 +483,7 @@ class ZorgvisieNonPremium(ZorgwelzijnNonPremium):
     index_url = "https://www.zorgvisie.nl/nieuws/"
 
 class MedischContact(GenericScraper):
+    use_http = True
     index_url = "https://www.medischcontact.nl/nieuws/laatste-nieuws.htm"
     article_url_re = "/nieuws/laatste-nieuws/artikel/[\w-]+"
 
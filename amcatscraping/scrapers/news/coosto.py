@@ -4,6 +4,9 @@ import tempfile
 import shutil
 import logging
 import itertools
+import functools
+import json
+import sqlite3
 import collections
 import iso8601
 import datetime
@@ -15,7 +18,7 @@ import os
 import argparse
 from datetime import date
 from selenium import webdriver
-from typing import Tuple
+from typing import List, Tuple
 from urllib.parse import urlparse
 from pathlib import Path
 
@@ -25,7 +28,11 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 #from amcat.models import Article
 from amcat.models import Article
-from amcatscraping.scraper import DeduplicatingUnitScraper, LoginMixin
+from amcatscraping.downloads import stream_download
+from amcatscraping.onlinetext import HostPool, NoScraper, ScraperRouter, get_text
+from amcatscraping.ratelimit import HostPolicy
+from amcatscraping.scraper import DeduplicatingUnitScraper, LoginMixin, SkipArticle
+from amcatscraping.workqueue import WorkQueue
 from amcatscraping.tools import parse_form, setup_logging
 from dutch_news_scrapers import all_scrapers
 
@@ -38,12 +45,51 @@ LOGIN_URL = "https://in.coosto.com/enter/signin"
 
 
 
-class SkipArticle(Exception):
-    pass
+RETRY_DIR = os.path.expanduser("~/.cache/scraperretries")
+
 
 class NotVisible(Exception):
     pass
 
+
+class RetryTable:
+    """
+    Units whose text could not be retrieved, stored in SQLite. Failed units are retried in
+    the next run until max_attempts; units without a scraper are only recorded.
+    """
+    def __init__(self, path: str, max_attempts=3):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = sqlite3.connect(path)
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS retries (url TEXT PRIMARY KEY, unit TEXT NOT NULL, "
+                       "status TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL DEFAULT 0)")
+        db.close()
+        self.queue = WorkQueue(path, "retries", key="url")
+        self.max_attempts = max_attempts
+        self.attempts = {}  # url -> attempts, for units claimed for retrying
+
+    def claim(self) -> List[dict]:
+        units = []
+        for row in self.queue.claim(100000, "failed", columns="unit, attempts"):
+            unit = json.loads(row["unit"])
+            self.attempts[unit["url"]] = row["attempts"]
+            units.append(unit)
+        if units:
+            log.info(f"Retrying {len(units)} articles which failed before")
+        return units
+
+    def record(self, unit: dict, status: str, error: Exception):
+        attempts = self.attempts.pop(unit["url"], 0) + 1
+        if status == "failed" and attempts >= self.max_attempts:
+            status = "gave_up"
+        row = {"url": unit["url"], "unit": json.dumps(unit), "error": repr(error), "attempts": attempts}
+        self.queue.put([row], status)
+
+    def completed(self, unit: dict, status="done"):
+        if self.attempts.pop(unit["url"], None) is not None:
+            self.queue.complete([unit["url"]], status)
+
+
 class CoostoScraper(LoginMixin, DeduplicatingUnitScraper):
     publisher = None # Will be set by scraper
 
@@ -55,6 +101,16 @@ class CoostoScraper(LoginMixin, DeduplicatingUnitScraper):
         #self.fromdate = self.options['fromdate']
         #self.todate = self.options['todate']
         self.proxy = self.options.get('proxy')
+       # if self.proxy:
+        #    kargs = dict(proxies={'https': f'socks5://localhost:{self.proxy}',
+         #                         'http': f'socks5://localhost:{self.proxy}'})
+        #else:
+        kargs = {}
+        self.router = ScraperRouter(all_scrapers(**kargs))
+        self.enrich_workers = int(self.options.get("enrich_workers", 16))
+        self.enrich_per_host = int(self.options.get("enrich_per_host", 2))
+        if not self.session.limiter.default.rate:
+            self.session.limiter.default = HostPolicy(rate=1, max_rate=4, concurrency=2, latency=2.0)
 
     def waitclick(self, selector, timeout=10, interval=0.1, by=By.CSS_SELECTOR):
         start = time.time()
@@ -93,19 +149,65 @@ class CoostoScraper(LoginMixin, DeduplicatingUnitScraper):
         """
         Retrieve the text of an article using any of the scrapers from online_scrapers
         """
-       # if self.proxy:
-        #    kargs = dict(proxies={'https': f'socks5://localhost:{self.proxy}',
-         #                         'http': f'socks5://localhost:{self.proxy}'})
-        #else:
-        kargs = {}
-        for scraper in all_scrapers(**kargs):
-            print(f"scraper is {scraper}")
-            if scraper.can_scrape(link):
-                logging.info(f"... Scraping {link} with {scraper}")
-                time.sleep(1)  # to avoid being banned (again) :)
-                return scraper.scrape_text(link)
-        logging.error(f"No scraper available for {link}")
-        raise SkipArticle(f"No scraper for {link}")
+        # Requests to the same site are throttled to avoid being banned (again) :)
+        return get_text(self.router, link, self.session.limiter)
+
+    def get_retries(self) -> RetryTable:
+        name = f"{self.__class__.__name__}_{self.project_id}_{self.articleset_id}.sqlite3"
+        return RetryTable(os.path.join(RETRY_DIR, name))
+
+    def _scrape_units(self, units):
+        """
+        Enrichment stage: fetch the texts of units concurrently, at most enrich_per_host at a
+        time per site, and yield (unit, result) pairs in the order they complete. Units that
+        failed in earlier runs are retried first. When the flush flag is set (the last unit of
+        an export) all pending units are finished before the next unit is read.
+        """
+        pool = HostPool(self.enrich_workers, self.enrich_per_host)
+        retries = self.get_retries()
+        seen = set()
+        try:
+            for unit in itertools.chain(retries.claim(), units):
+                flush, self.flush_flag = self.flush_flag, False
+                if unit["url"] in seen:
+                    continue
+                seen.add(unit["url"])
+                pool.submit(urlparse(unit["url"]).hostname, unit, self.scrape_unit, unit)
+                # Don't read too far ahead of the slowest sites
+                block = pool.pending >= 4 * self.enrich_workers
+                yield from self._get_enriched(pool, retries, block=block, drain=flush)
+            yield from self._get_enriched(pool, retries, drain=True)
+        finally:
+            pool.shutdown()
+
+    def _get_enriched(self, pool: HostPool, retries: RetryTable, block=False, drain=False):
+        while pool.pending:
+            item = pool.get(block=block or drain)
+            if item is None:
+                return
+            block = False
+            unit, future = item
+            if drain and not pool.pending:
+                self.set_flush_flag()
+            yield unit, functools.partial(self._get_enriched_result, retries, unit, future)
+
+    def _get_enriched_result(self, retries: RetryTable, unit, future):
+        try:
+            article = future.result()
+        except SkipArticle:
+            retries.completed(unit, "skipped")
+            raise
+        except NoScraper as e:
+            retries.record(unit, "no_scraper", e)
+            raise SkipArticle("No scraper available")
+        except Exception as e:
+            log.exception(f"Could not get text of {unit['url']}")
+            retries.record(unit, "failed", e)
+            raise SkipArticle(f"Failed, recorded for retrying: {e!r}")
+        retries.completed(unit)
+        if article is None:
+            raise SkipArticle("Advertorial")
+        return article
 
     def login(self, username, password):
         return True
@@ -121,39 +223,16 @@ class CoostoScraper(LoginMixin, DeduplicatingUnitScraper):
         #TODO: check/clear tmp dir
         self.wait("#button_export").click()
 
-        # Wait for file to be downloaded:
+        # Parse rows while the file is downloaded
         log.info("Downloading file..")
-        start = datetime.datetime.now()
-        while True:
-            time.sleep(0.3)
-            if (datetime.datetime.now() - start).total_seconds() > timeout:
-                raise IOError("Did not find file in {} within {} seconds".format(self.tmp_dir, timeout))
-            files = list(self.tmp_dir.glob("*.csv"))
-            if len(files) == 0:
-                continue
-            csvfile = files[0]
-            print(f"NAME is {csvfile}")
-            break
-        try:
-            # Wait for file to download
-            fsize_prev = -1
-            while True:
-                fsize = csvfile.stat().st_size
-                if fsize_prev == fsize:
-                    for thing in csv.DictReader(csvfile.open(), delimiter=";"):
-                       yield thing
-                    return
-                else:
-                    fsize_prev = fsize
-                time.sleep(0.3)
-        finally:
-            pass#csvfile.unlink()
+        lines = stream_download(str(self.tmp_dir), "*.csv", timeout=timeout)
+        yield from csv.DictReader(lines, delimiter=";")
 
     def get_deduplicate_units(self):
         log.info("Starting Firefox..")
 
         self.tmp_dir = Path(tempfile.mkdtemp(prefix="coosto-", suffix="-coosto"))
-        print(self.tmp_dir)
+        log.info("Downloading exports to {}".format(self.tmp_dir))
         fp = webdriver.FirefoxProfile()
         fp.set_preference("browser.download.folderList",2)
         fp.set_preference("browser.download.dir", str(self.tmp_dir))
@@ -260,7 +339,7 @@ class CoostoScraper(LoginMixin, DeduplicatingUnitScraper):
                     self.set_flush_flag()
                     yield last
         finally:
-            pass#shutil.rmtree(self.tmp_dir)
+            shutil.rmtree(str(self.tmp_dir), ignore_errors=True)
             #self.browser.quit()
 
     def get_deduplicate_key_from_unit(self, unit):
@@ -278,7 +357,8 @@ class CoostoScraper(LoginMixin, DeduplicatingUnitScraper):
             return
         text = self.get_text(unit['url'])
         if text is None:
-            raise Exception(f"Text is None for {unit['url']} (title: {title})")
+            # E.g. a liveblog or video page: retrying won't help
+            raise SkipArticle(f"No text for {unit['url']} (title: {title})")
         article = Article(title=title, text=text, url=unit["url"], date=date)
         article.set_property("author", unit["auteur"])
         article.set_property("publisher", publisher)
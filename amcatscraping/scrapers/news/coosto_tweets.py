@@ -25,11 +25,9 @@ import itertools
 import collections
 import iso8601
 import datetime
-import glob
 import time
 import csv
 import re
-import os
 import argparse
 from datetime import date
 from selenium import webdriver
@@ -42,6 +40,7 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 #from amcat.models import Article
 from amcat.models import Article
+from amcatscraping.downloads import stream_download
 from amcatscraping.scraper import DeduplicatingUnitScraper, LoginMixin
 from amcatscraping.tools import parse_form, setup_logging
 
@@ -98,36 +97,10 @@ class CoostoScraper(LoginMixin, DeduplicatingUnitScraper):
         Select(self.wait("#export_dialog_count_shards")).select_by_value('10000')
         self.wait("#button_export").click()
 
-        fname = os.path.join(self.tmp_dir, "*.csv")
-
-        # Wait for file to be downloaded:
+        # Parse rows while the file is downloaded
         log.info("Downloading file..")
-        start = datetime.datetime.now()
-        while True:
-            time.sleep(0.3)
-
-            if (datetime.datetime.now() - start).total_seconds() > timeout:
-                raise IOError("Did not find {} within {} seconds".format(fname, timeout))
-
-            try:
-                fname_ = next(iter(glob.glob(fname)))
-            except StopIteration:
-                continue
-            else:
-                # Wait for file to download
-                fsize = lambda : os.stat(fname_).st_size
-
-                fsize_prev = -1
-                while True:
-                    if fsize_prev == fsize():
-                        for thing in csv.DictReader(open(fname_), delimiter=";"):
-                            yield thing
-                        os.remove(fname_)
-                        return
-                    else:
-                        fsize_prev = fsize()
-
-                    time.sleep(0.3)
+        lines = stream_download(self.tmp_dir, "*.csv", timeout=timeout)
+        yield from csv.DictReader(lines, delimiter=";")
 
     def get_deduplicate_units(self):
         log.info("Starting Firefox..")
@@ -22,18 +22,18 @@ import logging
 import random
 import time
 import urllib.parse
-from itertools import count
 
 import lxml.html
 from collections import namedtuple
-from typing import Tuple, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Iterable, List, Optional
 
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 
 from amcat.models import Article
 from amcatscraping.scraper import SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScraper, NotVisible
-from amcatscraping.tools import html2text
+from amcatscraping.tools import html2text, get_boolean
 
 NewsdeskUnit = namedtuple("NewsdeskUnit", ["article_element", "article"])
 
@@ -59,6 +59,16 @@ def dutch_strptime(date, pattern):
         locale.setlocale(locale.LC_ALL, loc)
 
 
+def get_data_urls_from_html(article_doc):
+    seen = set()
+    for a in article_doc.cssselect("a"):
+        href = a.get("href")
+        if href and href.startswith(DATA_URL):
+            if href not in seen:
+                yield href
+                seen.add(href)
+
+
 def get_data_urls(article_element):
     seen = set()
     for a in article_element.find_elements_by_css_selector("a"):
@@ -68,6 +78,30 @@ def get_data_urls(article_element):
                 yield href
                 seen.add(href)
 
+ARTICLE_LIST_SCRIPT = """
+var list = document.querySelector(".nd-article-list");
+return list && list.outerHTML;
+"""
+
+FIRST_HEADLINE_SCRIPT = """
+var headline = document.querySelector(".nd-article-list > article a.nd-article__headline-text");
+return headline && headline.href;
+"""
+
+class ArticleElement(object):
+    """Reference to the n-th article of the current result page, which is only looked up in the
+    browser when it's needed"""
+    def __init__(self, browser, n):
+        self.browser = browser
+        self.selector = ".nd-article-list > article:nth-of-type({})".format(n)
+        self.element = None
+
+    def get(self):
+        if self.element is None:
+            self.element = self.browser.find_element_by_css_selector(self.selector)
+        return self.element
+
+
 # c = amcatscraping.scrapers.news.newsdesk.CONTEXT
 CONTEXT = {}
 class NewsdeskScraper(SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScraper):
@@ -77,9 +111,18 @@ class NewsdeskScraper(SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScrape
     login_password_field = "#password"
     login_error_selector = "form .error_block"
 
-    def is_cached(self, unit: NewsdeskUnit):
-        key = self._get_deduplicate_key_from_unit(unit)
-        return self.cache.sismember(self._get_redis_key(), key)
+    # Units hold elements of the current result page, which go stale once we page further
+    deduplicate_window = 1
+
+    def __init__(self, *args, **kwargs):
+        super(NewsdeskScraper, self).__init__(*args, **kwargs)
+
+        # Fetch article texts over HTTP (with the browser's cookies) instead of opening them in a
+        # window. Texts of a result page are fetched concurrently while its units are scraped.
+        self.direct_text = get_boolean(self.options.get("direct_text", "no"))
+        self.direct_text_workers = int(self.options.get("direct_text_workers", 4))
+        self.text_pool = None
+        self.text_futures = {}  # article url -> future of its text
 
     def get_browser_preferences(self):
         yield "intl.accept_languages", "nl"
@@ -89,6 +132,20 @@ class NewsdeskScraper(SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScrape
 
         self.browser.get(SEARCH_URL)
 
+        if self.direct_text:
+            self.copy_browser_cookies()
+            self.text_pool = ThreadPoolExecutor(max_workers=self.direct_text_workers)
+
+    def teardown_session(self, failed=False):
+        if self.text_pool is not None:
+            self.text_pool.shutdown(wait=False)
+            self.text_pool = None
+        super(NewsdeskScraper, self).teardown_session(failed=failed)
+
+    def copy_browser_cookies(self):
+        for cookie in self.browser.get_cookies():
+            self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+
     def get_deduplicate_key_from_unit(self, unit: NewsdeskUnit) -> str:
         return unit.article.url
 
@@ -129,32 +186,26 @@ class NewsdeskScraper(SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScrape
         self.browser.find_elements_by_css_selector(".data-table__page-size-options .paginator__button")[0].click()
 
         # Find articles
+        previous_page = None
         while True:
-            start = datetime.datetime.now()
-        #    print(start)
-            #while datetime.datetime.now() - start < datetime.timedelta(seconds=30):
-             #   ajax_mask = self.wait("#article_ajax_mask", visible=False)
-              #  if not ajax_mask.is_displayed():
-               #     time.sleep(1)
-                #    break
-
-            time.sleep(5)
+            # Wait for the (next) result page to be rendered
+            if previous_page is not None:
+                self.wait_until(lambda: self._get_first_headline() not in (None, previous_page),
+                                timeout=120, description="next result page")
+            self.wait_network_idle()
 
             # Yield articles
-            self.wait(".nd-article-list")
-            articles = self.browser.find_elements_by_css_selector(".nd-article-list > article")
-            print(f"Found {len(articles)} articles")
-            #article_units = list(map(self.scrape_unit_meta, articles))
-            article_units = [self.scrape_unit_meta(a) for a in articles]
-            #article_units = list()
-            #for article in articles:
-            #    article_units.append(self.scrape_unit_meta(article))
-
-            #   print(f"units{article_units}")
+            self.wait(".nd-article-list > article")
+            previous_page = self._get_first_headline()
+            article_units = self.get_page_units()
+            print(f"Found {len(article_units)} articles")
 
             # If first and last article were already in db, we're done
-            first_article_cached = self.is_cached(article_units[0])
-            last_article_cached = self.is_cached(article_units[-1])
+            cached = self.are_cached(article_units)
+            first_article_cached, last_article_cached = cached[0], cached[-1]
+
+            if self.direct_text:
+                self.prefetch_texts([unit for unit, c in zip(article_units, cached) if not c])
 
             yield from article_units
 
@@ -167,16 +218,23 @@ class NewsdeskScraper(SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScrape
                 else:
                     next_page_button.click()
 
+    def _get_first_headline(self):
+        return self.browser.execute_script(FIRST_HEADLINE_SCRIPT)
+
+    def get_page_units(self) -> List[NewsdeskUnit]:
+        """Parse all units of the current result page from a single snapshot of its HTML"""
+        list_html = self.browser.execute_script(ARTICLE_LIST_SCRIPT)
+        list_doc = lxml.html.fromstring(list_html, base_url=SEARCH_URL)
+        articles = list_doc.cssselect(".nd-article-list > article")
+        return [self.scrape_unit_meta(article_doc, ArticleElement(self.browser, n))
+                for n, article_doc in enumerate(articles, start=1)]
+
     def get_url_and_date_from_unit(self, unit: NewsdeskUnit) -> Tuple[str, datetime.date]:
         return unit.article.url, unit.article.date
 
-    def scrape_unit_meta(self, article_element):
+    def scrape_unit_meta(self, article_doc, article_element: "ArticleElement"):
         CONTEXT['unit'] = article_element
-
-        article_html = article_element.get_attribute("outerHTML")
-     #   print(f"dit is html{article_html}")
-        article_doc = lxml.html.fromstring(article_html, base_url=SEARCH_URL)
-        CONTEXT['doc'] = article_element
+        CONTEXT['doc'] = article_doc
 
         def get_byline_prop(prop):
             for meta_element in article_doc.cssselect(f".nd-article__{prop}"):
@@ -220,14 +278,45 @@ class NewsdeskScraper(SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScrape
             pass
         return NewsdeskUnit(article_element, article)
 
+    def prefetch_texts(self, units: List[NewsdeskUnit]):
+        self.text_futures = {unit.article.url: self.text_pool.submit(self._get_article_text_http, unit.article)
+                             for unit in units}
+
     def scrape_unit(self, unit: NewsdeskUnit):
         article_element, article = unit
-        text, data_urls = self._get_article_text(article_element, article)
+
+        future = self.text_futures.pop(article.url, None)
+        try:
+            result = future and future.result()
+        except Exception:
+            logging.exception(f"Fetching text of {article.title} failed, opening it in the browser instead")
+            result = None
+
+        text, data_urls = result or self._get_article_text(article_element.get(), article)
         article.text = text
         for i, data_url in enumerate(data_urls):
             article.set_property("data{}_url".format(i), data_url)
         return article
 
+    def _get_article_text_http(self, article) -> Optional[Tuple[str, List[str]]]:
+        """Fetch text and data urls of article from its text_url. Returns None if the page does
+        not contain the article body, for example because our session expired."""
+        doc = self.session.get_html(urllib.parse.urljoin(SEARCH_URL, article.get_property("text_url")))
+        art = doc.cssselect("#article")
+        if not art:
+            return None
+
+        ps = art[0].cssselect(".article_extract p")
+        if ps:
+            text = "\n\n".join(p.text_content().strip() for p in ps)
+        elif article.get_property("wordcount_int") <= 1:
+            text = "-"
+        else:
+            return None
+
+        data_urls = list(get_data_urls_from_html(art[0]))[:3]
+        return text, data_urls
+
     def _get_article_text(self, article_element, article):
         # Click on headline to open text in new window.
         # First, remember current window handle so we can switch back
@@ -238,12 +327,8 @@ class NewsdeskScraper(SeleniumLoginMixin, SeleniumMixin, DeduplicatingUnitScrape
             # open new window and get handle
             existing_handles = driver.window_handles
             article_element.find_element_by_css_selector("a.nd-article__headline-text").click()
-            for i in count():
-                if len(driver.window_handles) == len(existing_handles):
-                    break
-                if i > 100:
-                    raise Exception("Giving up waiting for the handle...")
-                time.sleep(1.5)
+            self.wait_until(lambda: len(driver.window_handles) > len(existing_handles),
+                            timeout=150, description="article window")
             new_handle, = set(driver.window_handles) - set(existing_handles)
             print(f"Got handle: {new_handle}")
             driver.switch_to_window(new_handle)
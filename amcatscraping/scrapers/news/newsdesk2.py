@@ -100,6 +100,7 @@ def extract_body(preview):
 
 def extract_meta(preview):
     """Extract all metadata fields from the preview pane, returns a sequence of key, value pairs"""
+    driver = preview.parent
     # metadata are div/span.SS_bf before body header and span.SS_bf after the classification header
     try:
         body = wait(preview, "#JUMPTO_Body")
@@ -120,6 +121,63 @@ def extract_meta(preview):
         yield key, value.strip(':')
 
 
+# Extracts body and metadata from a preview pane in one go, following the same rules as
+# extract_body() and extract_meta(). Returns null if the pane is not fully loaded yet.
+EXTRACT_PREVIEW_SCRIPT = """
+var preview = arguments[0];
+var body = preview.querySelector("#JUMPTO_Body");
+if (!body) {
+    body = preview.querySelector("h2.SS_Banner");
+    if (!body) return null;
+    if (body.innerText.trim() !== "Graphic") return {error: "unexpected graphic " + body.innerText};
+}
+var classification = preview.querySelector("#JUMPTO_Classification");
+if (!classification) return null;
+
+var paras = [], meta = [];
+function addMeta(span) {
+    var key = span.textContent.trim().replace(/^:+|:+$/g, "").replace(/[ -]/g, "");
+    var node = span.nextSibling;
+    while (node && node.nodeType !== Node.TEXT_NODE) node = node.nextSibling;
+    var value = node ? node.textContent.trim().replace(/^:+|:+$/g, "") : "";
+    meta.push([key, value]);
+}
+
+for (var e = body.parentNode.firstElementChild; e !== body; e = e.nextElementSibling) {
+    if (e.tagName === "DIV") {
+        for (var i = 0; i < e.children.length; i++) {
+            if (e.children[i].tagName === "SPAN" && e.children[i].className === "SS_bf") addMeta(e.children[i]);
+        }
+    }
+}
+for (var e = body.nextElementSibling; e && e !== classification; e = e.nextElementSibling) {
+    if (e.tagName === "P") paras.push(e.innerText);
+}
+for (var e = classification.nextElementSibling; e; e = e.nextElementSibling) {
+    if (e.tagName === "SPAN" && e.className === "SS_bf") addMeta(e);
+}
+return {text: paras.join("\\n\\n"), meta: meta};
+"""
+
+
+def extract_preview(preview, timeout=60, interval=0.1):
+    """Extract body text and metadata from a preview pane with a single script per attempt.
+    Returns (text, [(key, value), ...])"""
+    driver = preview.parent
+    start = time.time()
+    while True:
+        result = driver.execute_script(EXTRACT_PREVIEW_SCRIPT, preview)
+        if result is not None:
+            break
+        if time.time() > start + timeout:
+            raise NoSuchElementException("Preview pane did not load")
+        time.sleep(interval)
+
+    if "error" in result:
+        raise Exception(result["error"])
+    return result["text"], [tuple(pair) for pair in result["meta"]]
+
+
 def extract_date(art):
     """Get the date from an article listing element"""
     dates = art.find_elements_by_css_selector("div.dataInfo.translate dd a")
@@ -128,10 +186,13 @@ def extract_date(art):
 
 CURRENT_ARTICLE = None
 
-def scrape_article(art, medium):
-    """Scrape a single nexis article. Art should be a references to the result list LI element"""
+def scrape_article(art, medium, bulk=True):
+    """Scrape a single nexis article. Art should be a references to the result list LI element.
+    If bulk is False, body and metadata are read element by element (slow, but useful when the
+    injected script breaks on a layout change)."""
     global CURRENT_ARTICLE
     CURRENT_ARTICLE = art
+    driver = art.parent
     result = {}
     result['publisher'] = medium
     result['title'] = art.find_element_by_css_selector("h2.doc-title.translate").text
@@ -142,10 +203,13 @@ def scrape_article(art, medium):
     # Wait until the preview window ('aside') is opened so we can select the text
     preview = wait(driver, "aside.ladialog,aside.gvs-dialog")
     # Extract body and metadata
-    result['text'] = extract_body(preview)
+    if bulk:
+        result['text'], meta = extract_preview(preview)
+    else:
+        result['text'], meta = extract_body(preview), extract_meta(preview)
     if result['text'] == "":
         result['text'] ="-"
-    for key, value in extract_meta(preview):
+    for key, value in meta:
         result[key] = value
 
     # Close preview pane by clicking on [Sluiten] button on bottom right
@@ -188,7 +252,7 @@ def set_result_sort(driver, direction="datedescending"):
     # 3- Wait until dropdown is hidden so preview button is exposed again
     wait_loadbox(driver)
 
-def scrape_nexis(driver, medium, from_date, to_date, query):
+def scrape_nexis(driver, medium, from_date, to_date, query, bulk=True):
     # switch to power search
     wait(driver, "ul.advancesearch.getadoc button").click()
     # enter query
@@ -218,7 +282,7 @@ def scrape_nexis(driver, medium, from_date, to_date, query):
 
     while True:
         article_list = waits(driver, 'ol.nexisuni-result-list li:not(.breadcrumb-list)')
-        yield [scrape_article(art, medium) for art in article_list]
+        yield [scrape_article(art, medium, bulk=bulk) for art in article_list]
         next = driver.find_elements_by_css_selector("nav.pagination li")[-1]
         if next.get_attribute("class") == "disabled":
             break
@@ -239,6 +303,9 @@ if __name__ == '__main__':
     parser.add_argument("to_date", help="Date to which to get articles")
     parser.add_argument("query", help="searchstring")
     parser.add_argument("--geckodriver", help="Path of geckodriver executable (default=~/geckodriver)")
+    parser.add_argument("--batch-size", help="Number of articles to upload at once (default=100)", type=int, default=100)
+    parser.add_argument("--element-extraction", help="Read previews element by element instead of with one script",
+                        action="store_true")
 
     args = parser.parse_args()
 
@@ -253,8 +320,28 @@ if __name__ == '__main__':
 
     login_nexis(driver, args.login, args.password)
 
-    for page in scrape_nexis(driver, args.medium, from_date, to_date, args.query):
-        conn.create_articles(args.amcat_project, args.amcat_set, page)
+    # Upload in the background, so we can scrape the next page in the meantime
+    from amcatscraping.uploader import Uploader
+    uploader = Uploader(lambda batch: conn.create_articles(args.amcat_project, args.amcat_set, batch))
+
+    batch = []
+    pages = scrape_nexis(driver, args.medium, from_date, to_date, args.query, bulk=not args.element_extraction)
+    try:
+        for page in pages:
+            batch.extend(page)
+            if len(batch) >= args.batch_size:
+                uploader.put(batch)
+                batch = []
+            for _ in uploader.completed():
+                pass
+        if batch:
+            uploader.put(batch)
+    except BaseException:
+        uploader.abort()
+        raise
+
+    n = len(list(uploader.close()))
+    print(f"Uploaded {n} articles")
 
 
 
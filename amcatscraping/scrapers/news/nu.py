@@ -16,18 +16,17 @@
 # You should have received a copy of the GNU Lesser General Public        #
 # License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
 ###########################################################################
-import feedparser
 import iso8601
 import dateparser
 
 from amcat.models import Article
-from amcatscraping.scraper import DeduplicatingUnitScraper
+from amcatscraping.scraper import DeduplicatingUnitScraper, FeedMixin
 from amcatscraping.tools import html2text
 
 RSS_URL = "http://www.nu.nl/rss"
 
 
-class NuScraper(DeduplicatingUnitScraper):
+class NuScraper(FeedMixin, DeduplicatingUnitScraper):
     publisher = "nu.nl"
 
     def __init__(self, *args, **kwargs):
@@ -40,8 +39,7 @@ class NuScraper(DeduplicatingUnitScraper):
         return article.get_property("nuid")
 
     def get_deduplicate_units(self):
-        for entry in feedparser.parse(RSS_URL)["entries"]:
-            yield entry
+        yield from self.get_feed_entries(RSS_URL)
 
     def get_article_section_text(self, url):
         article_doc = self.session.get_html(url)
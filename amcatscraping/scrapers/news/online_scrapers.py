@@ -1,6 +1,7 @@
 """
 Scraper classes that can scrape various online news sources
 """
+import asyncio
 import re
 from typing import Optional
 
@@ -8,6 +9,16 @@ from lxml import html
 import logging
 import requests
 from lxml.html import Element
+from requests.cookies import get_cookie_header
+
+
+# Site scrapers returned by all_scrapers, added using @register
+SCRAPER_CLASSES = []
+
+
+def register(cls):
+    SCRAPER_CLASSES.append(cls)
+    return cls
 
 
 def create_cookie(domain, name, value):
@@ -21,8 +32,11 @@ def create_cookie(domain, name, value):
 class Scraper:
     URL_MATCH = None
     DOMAIN = None
+    # Return None instead of raising an error for articles that no longer exist
+    SKIP_NOT_FOUND = False
 
     def __init__(self, proxies:Optional[dict]=None):
+        self.url_regex = None
         self.session = requests.session()
         if proxies:
             self.session.proxies.update(proxies)
@@ -32,21 +46,45 @@ class Scraper:
         pass
 
     def scrape_text(self, url: str):
-        page = self.session.get(url)
         if "advertorial" in url:
             return
+        page = self.session.get(url)
+        if page.status_code == 404 and self.SKIP_NOT_FOUND:
+            return
         page.raise_for_status()
-        open("/tmp/test7.html", "w").write(page.text)
         tree = html.fromstring(page.text)
         return self.parse_html(tree)
 
+    async def scrape_text_async(self, client, url: str, executor=None):
+        """
+        Like scrape_text, but fetches the page with a (shared) aiohttp.ClientSession, using the
+        cookies of self.session, and parses it in executor
+        """
+        if "advertorial" in url:
+            return
+        if self.session.proxies:
+            # aiohttp can't use our (socks) proxies
+            return await asyncio.get_event_loop().run_in_executor(executor, self.scrape_text, url)
+        cookies = get_cookie_header(self.session.cookies, requests.Request("GET", url))
+        headers = {"Cookie": cookies} if cookies else {}
+        async with client.get(url, headers=headers) as page:
+            if page.status == 404 and self.SKIP_NOT_FOUND:
+                return
+            page.raise_for_status()
+            content = await page.read()
+        return await asyncio.get_event_loop().run_in_executor(executor, self._parse, content)
+
+    def _parse(self, content: bytes) -> str:
+        return self.parse_html(html.fromstring(content))
+
     def parse_html(self, page: Element) -> str:
         raise NotImplementedError()
 
     def can_scrape(self, url: str) -> bool:
         """Can this scraper handle this url?"""
-        pattern = self._get_url_match()
-        return bool(re.match(pattern, url))
+        if self.url_regex is None:
+            self.url_regex = re.compile(self._get_url_match())
+        return bool(self.url_regex.match(url))
 
     def _get_url_match(self):
         if self.URL_MATCH:
@@ -57,6 +95,7 @@ class Scraper:
             raise Exception("Specify either DOMAIN or URL_MATCH")
 
 
+@register
 class TELScraper(Scraper):
     DOMAIN = "telegraaf.nl"
     COOKIES = {
@@ -71,14 +110,10 @@ class TELScraper(Scraper):
     def initialize(self):
         for name, value in self.COOKIES.items():
             self.session.cookies.set(**create_cookie("www.telegraaf.nl", name, value))
-            r = self.session.get("https://www.telegraaf.nl/nieuws/1071777683/pvd-a-ers-houden-samengaan-met-groen-links-af")
-            r.raise_for_status()
+        r = self.session.get("https://www.telegraaf.nl/nieuws/1071777683/pvd-a-ers-houden-samengaan-met-groen-links-af")
+        r.raise_for_status()
 
-    def scrape_text(self, url):
-        page = self.session.get(url)
-        page.raise_for_status()
-        open("/tmp/test7.html", "w").write(page.text)
-        tree = html.fromstring(page.text)
+    def parse_html(self, tree) -> str:
         for label in tree.cssselect("span.label"):
             if label.text_content().strip().startswith("Liveblog"):
                 return None
@@ -88,21 +123,17 @@ class TELScraper(Scraper):
         return text
 
 
+@register
 class VKScraper(Scraper):
     DOMAIN = "volkskrant.nl"
+    SKIP_NOT_FOUND = True
     COOKIE_URL = "https://www.volkskrant.nl/privacy-wall/accept?redirectUri=%2f&pwv=2&pws=functional%7Canalytics%7Ccontent_recommendation%7Ctargeted_advertising%7Csocial_media&days=390&referrer="
 
     def initialize(self):
         r = self.session.post(self.COOKIE_URL)
         r.raise_for_status()
 
-    def scrape_text(self, url):
-        page = self.session.get(url)
-        if page.status_code == 404:
-            return
-        page.raise_for_status()
-        open("/tmp/test7.html", "w").write(page.text)
-        tree = html.fromstring(page.text)
+    def parse_html(self, tree) -> str:
         lead = tree.cssselect("p.artstyle__intro")
         if not lead:
             lead ="-"
@@ -112,22 +143,17 @@ class VKScraper(Scraper):
         text = re.sub("\n\n\s*", "\n\n", text)
         return text
 
+@register
 class TRWScraper(Scraper):
     DOMAIN = "trouw.nl"
+    SKIP_NOT_FOUND = True
     COOKIE_URL = "https://www.trouw.nl/privacy-wall/accept?redirectUri=%2f&pwv=2&pws=functional%7Canalytics%7Ccontent_recommendation%7Ctargeted_advertising%7Csocial_media&days=390&referrer="
 
     def initialize(self):
         r = self.session.post(self.COOKIE_URL)
         r.raise_for_status()
 
-    def scrape_text(self, url):
-        print(f"TRWScraper: {url}")
-        page = self.session.get(url)
-        if page.status_code == 404:
-            return
-        page.raise_for_status()
-        open("/tmp/test7.html", "w").write(page.text)
-        tree = html.fromstring(page.text)
+    def parse_html(self, tree) -> str:
         lead = tree.cssselect("p.artstyle__intro")
         if not lead:
             lead ="-"
@@ -138,21 +164,17 @@ class TRWScraper(Scraper):
         return text
 
 
+@register
 class ADScraper(Scraper):
     DOMAIN = "ad.nl"
+    SKIP_NOT_FOUND = True
     COOKIE_URL = "https://www.ad.nl/privacy-gate/accept?redirectUri=%2f&pwv=2&pws=functional%7Canalytics%7Ccontent_recommendation%7Ctargeted_advertising%7Csocial_media&days=390&referrer="
 
     def initialize(self):
         r = self.session.post(self.COOKIE_URL)
         r.raise_for_status()
 
-    def scrape_text(self, url):
-        page = self.session.get(url)
-        if page.status_code == 404:
-            return
-        page.raise_for_status()
-        open("/tmp/test7.html", "w").write(page.text)
-        tree = html.fromstring(page.text)
+    def parse_html(self, tree) -> str:
         lead_ps = tree.cssselect('p.article__intro')
         body_ps = tree.cssselect('p.article__paragraph')
         text = "\n\n".join(p.text_content() for p in lead_ps + body_ps)
@@ -160,6 +182,7 @@ class ADScraper(Scraper):
         return text
 
 
+@register
 class NUScraper(Scraper):
     DOMAIN = "nu.nl"
 
@@ -177,6 +200,7 @@ class NUScraper(Scraper):
         return text
 
 
+@register
 class NOSScraper(Scraper):
     DOMAIN = "nos.nl"
 
@@ -190,6 +214,7 @@ class NOSScraper(Scraper):
         text = re.sub("\n\n\s*", "\n\n", text)
         return text
 
+@register
 class NRCScraper(Scraper):
     DOMAIN = "nrc.nl"
 
@@ -200,6 +225,7 @@ class NRCScraper(Scraper):
         text = re.sub("\n\n\s*", "\n\n", text)
         return text
 
+@register
 class RTLScraper(Scraper):
     DOMAIN = "rtlnieuws.nl"
 
@@ -216,15 +242,5 @@ SCRAPERS = None
 def all_scrapers(**kargs):
     global SCRAPERS
     if SCRAPERS is None:
-        SCRAPERS = [ADScraper(**kargs),
-            NOSScraper(**kargs),
-            NUScraper(**kargs),
-            VKScraper(**kargs),
-            TELScraper(**kargs),
-            RTLScraper(**kargs),
-            NRCScraper(**kargs),
-            TRWScraper(**kargs),
-            ]
+        SCRAPERS = [cls(**kargs) for cls in SCRAPER_CLASSES]
     return SCRAPERS
-
-
@@ -1,94 +1,147 @@
+import functools
 import logging
-import sqlite3
+import multiprocessing
 from pathlib import Path
+from typing import Union
 
+from aiohttp import ClientResponseError
 from requests import HTTPError
 from amcatclient import AmcatAPI
 
+from amcatscraping.onlinetext import NoScraper, ScraperRouter, get_text, scrape_texts
+from amcatscraping.workqueue import WorkQueue
 from online_scrapers import all_scrapers
 
 
-def get_text(link: str) -> str:
-    """
-    Retrieve the text of an article using any of the scrapers from online_scrapers
-    """
-    for scraper in all_scrapers():
-        if scraper.can_scrape(link):
-            return scraper.scrape_text(link)
-    logging.error(f"No scraper available for {link}")
-    raise SkipArticle(f"No scraper for {link}")
+ARTICLE_COLUMNS = "public_link as url, title, medium as publisher, date"
 
+# Articles whose text could not be retrieved are retried after RETRY_DELAY seconds, and get
+# status 'error' after failing MAX_ATTEMPTS times
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 600
 
-def get_articles(conn, where="status is 'public'", n=100):
+
+def get_queue(db: Path) -> WorkQueue:
     """
-    Retrieve articles to scrape from local db
+    Queue of the articles in the local db, which can be shared by several workers
     """
-    cur = conn.cursor()
-    cur.execute(f"SELECT public_link as url, title, medium as publisher, date FROM articles where {where} limit {n}")
-    colnames = [x[0] for x in cur.description]
-    rows = cur.fetchall()
-    return [dict(zip(colnames, r)) for r in rows]
+    return WorkQueue(str(db), "articles", key="public_link")
+
+
+@functools.lru_cache()
+def get_router() -> ScraperRouter:
+    """Router over all online scrapers, built once per worker process"""
+    return ScraperRouter(all_scrapers())
 
 
 class SkipArticle(Exception):
     pass
 
-def scrape_article(article: dict) -> str:
+def check_article(article: dict):
     """
-    Retrieve the text for an online article using online_scrapers
+    Raise SkipArticle if an article should not be scraped
     Article should be a dict containing at least a url and title
     """
     link = article['url']
     if ('video' in link) or ('redirect' in link) or ('Liveblog' in article['title']):
         raise SkipArticle("Video/redirect/liveblog")
-    try:
-        text = get_text(link)
-    except HTTPError as err:
-        if (err.response.status_code == 404) or (err.response.status_code == 403) or (err.response.status_code == 410):
+
+
+def get_article_text(article: dict, result: Union[str, Exception]) -> str:
+    """
+    Return the text of an article given the result of scrape_texts: its text, or the exception raised
+    """
+    link = article['url']
+    if isinstance(result, NoScraper):
+        logging.error(f"No scraper available for {link}")
+        raise SkipArticle(f"No scraper for {link}")
+    if isinstance(result, (HTTPError, ClientResponseError)):
+        status = result.response.status_code if isinstance(result, HTTPError) else result.status
+        if (status == 404) or (status == 403) or (status == 410):
             logging.error(f"Article not found (404, 403): {link}")
             raise SkipArticle("404")
-        else:
-            raise
-    if not text:
+    if isinstance(result, Exception):
+        raise result
+    if not result:
         raise SkipArticle("Empty")
-    return text
+    return result
 
 
-def set_status(conn, articles, status='done'):
+def scrape_article(article: dict) -> str:
     """
-    Upoate the status of the articles in the local db
+    Retrieve the text for an online article using online_scrapers
+    Article should be a dict containing at least a url and title
     """
-    urls = ",".join(f"'{a['url']}'" for a in articles)
-    with conn:
-        cur = conn.cursor()
-        cur.execute(f"Update articles set status = '{status}' where public_link in ({urls})")
+    check_article(article)
+    try:
+        text = get_text(get_router(), article['url'])
+    except Exception as err:
+        text = err
+    return get_article_text(article, text)
 
 
-def scrape_articles(db, amcat_conn, project, articleset):
+def scrape_articles(queue: WorkQueue, amcat_conn, project, articleset, workers=16, per_host=4, batch_size=100):
+    router = get_router()
     while True:
         logging.info("Retrieving articles to scrape from database")
-        articles = get_articles(db)
+        articles = queue.claim(batch_size, "public", columns=ARTICLE_COLUMNS)
         if not articles:
             break
-        to_save = []
-        to_skip = []
+        try:
+            to_save, to_skip, to_retry = scrape_batch(articles, router, workers, per_host)
+        except BaseException:
+            queue.release(a['url'] for a in articles)
+            raise
 
-        for i, article in enumerate(articles):
-            logging.info(f"[{i + 1}/{len(articles)}] Scraping article {article['url']}")
+        queue.complete((a['url'] for a in to_skip), status='skip')
+        queue.fail((a['url'] for a in to_retry), status='error', max_attempts=MAX_ATTEMPTS, delay=RETRY_DELAY)
+        logging.info(f"Saving {len(to_save)} articles, skipped {len(to_skip)}, failed {len(to_retry)}")
+        if to_save:
             try:
-                print(article['url'])
-                article['text'] = scrape_article(article)
-                to_save.append(article)
-            except SkipArticle:
-                to_skip.append(article)
+                amcat_conn.create_articles(project, articleset, to_save)
+            except BaseException:
+                queue.release(a['url'] for a in to_save)
+                raise
+            queue.complete((a['url'] for a in to_save), status='done')
 
-        logging.info(f"Saving {len(to_save)} articles, skipped {len(to_skip)}")
+    logging.info("DONE")
 
-        amcat_conn.create_articles(project, articleset, to_save)
-        set_status(conn, to_save, status='done')
-        set_status(conn, to_skip, status='skip')
 
-    logging.info("DONE")
+def scrape_batch(articles, router, workers, per_host):
+    """
+    Scrape the texts of a batch of articles
+    @return: (articles with their text, articles to skip, articles which failed)
+    """
+    to_scrape = []
+    to_save = []
+    to_skip = []
+    to_retry = []
+
+    for article in articles:
+        try:
+            check_article(article)
+            to_scrape.append(article)
+        except SkipArticle:
+            to_skip.append(article)
+
+    logging.info(f"Scraping {len(to_scrape)} articles")
+    texts = scrape_texts([a['url'] for a in to_scrape], router, workers=workers, per_host=per_host)
+    for article in to_scrape:
+        try:
+            article['text'] = get_article_text(article, texts[article['url']])
+            to_save.append(article)
+        except SkipArticle:
+            to_skip.append(article)
+        except Exception as err:
+            logging.warning(f"Could not scrape {article['url']}: {err!r}")
+            to_retry.append(article)
+    return to_save, to_skip, to_retry
+
+
+def run_worker(args):
+    queue = get_queue(args.db)
+    c = AmcatAPI(args.amcat)
+    scrape_articles(queue, c, args.project, args.articleset, workers=args.workers, per_host=args.per_host)
 
 
 if __name__ == '__main__':
@@ -99,12 +152,20 @@ if __name__ == '__main__':
     parser.add_argument("amcat", help="AmCAT host to connect to")
     parser.add_argument("project", help="AmCAT project")
     parser.add_argument("articleset", help="AmCAT articleset")
+    parser.add_argument("--workers", help="Number of articles to scrape at a time", type=int, default=16)
+    parser.add_argument("--per-host", help="Number of articles to scrape at a time per site", type=int, default=4)
+    parser.add_argument("--processes", help="Number of worker processes", type=int, default=1)
     args = parser.parse_args()
 
     if not args.db.exists():
         raise Exception(f"Database {args.db} does not exist")
-    conn = sqlite3.connect(str(args.db))
-    c = AmcatAPI(args.amcat)
     logging.info(f"Scraping articles from {args.db} to {args.amcat} set {args.project}:{args.articleset}")
-    scrape_articles(conn, c, args.project, args.articleset)
-
+    get_queue(args.db).close()  # add queue columns once, before the workers start
+    if args.processes == 1:
+        run_worker(args)
+    else:
+        processes = [multiprocessing.Process(target=run_worker, args=(args,)) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
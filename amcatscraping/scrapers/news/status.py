@@ -1,21 +1,29 @@
 import logging
-import sqlite3
 from pathlib import Path
 
+from amcatscraping.workqueue import WorkQueue
+
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("db", help="Name database where articles are stored", type=Path)
+    parser.add_argument("--window", help="Minutes over which to compute throughput", type=float, default=10)
     args = parser.parse_args()
     logging.basicConfig(level=logging.INFO, format='[%(asctime)s %(name)-12s %(levelname)-5s] %(message)s')
 
     if not args.db.exists():
         raise Exception(f"Database {args.db} does not exist")
-    conn = sqlite3.connect(str(args.db))
+    queue = WorkQueue(str(args.db), "articles", key="public_link")
 
-    SQL = "select status, count(*) from articles group by status"
-    cur = conn.cursor()
-    cur.execute(SQL)
-    rows = cur.fetchall()
-    for status, n in rows:
+    counts = queue.get_counts()
+    for status, n in counts.items():
         print(f"{status}: {n}")
+
+    backlog = counts.get("public", 0)
+    rate = queue.get_completed(args.window * 60) / args.window
+    print(f"in progress: {queue.get_leased()}")
+    print(f"throughput: {rate:.1f} articles/minute (last {args.window:g} minutes)")
+    if rate:
+        print(f"backlog: {backlog} articles, about {backlog / rate:.0f} minutes to go")
+    else:
+        print(f"backlog: {backlog} articles")
@@ -294,11 +294,11 @@ class EPagesScraper(SeleniumLoginMixin, SeleniumMixin, DateRangeScraper, Dedupli
         p.find_element_by_id("chooseButton").click()
 
     def get_deduplicate_units(self):
-        for date in self.dates:
-            if self.editions is not None:
-                for edition in self.editions:
-                    yield from self._get_deduplicate_units(date, edition)
-            else:
+        if self.editions is not None:
+            for date, edition in self.iter_dates(self.editions):
+                yield from self._get_deduplicate_units(date, edition)
+        else:
+            for date in self.iter_dates():
                 yield from self._get_deduplicate_units(date)
 
     def scrape_unit(self, unit: EPagesUnit):
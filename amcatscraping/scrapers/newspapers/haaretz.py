@@ -59,7 +59,7 @@ class HaaretzScraper(LoginMixin, UnitScraper, DateRangeScraper):
                 yield article
 
     def get_pages(self):
-        for date in self.dates:
+        for date in self.iter_dates():
             for p in self.get_pages_for_date(date):
                 yield p
                 
@@ -64,7 +64,7 @@ class NRCScraper(LoginMixin, UnitScraper, DateRangeScraper):
         return response.status_code == 302 # if login incorrect, it returns 401
 
     def get_units(self):
-        for date in self.dates:
+        for date in self.iter_dates():
             if date.weekday() == 6: # sunday
                 continue
             data_url = f"https://www.nrc.nl/de/data/NH/{date.year}/{date.month}/{date.day}/"
@@ -18,10 +18,8 @@
 ###########################################################################
 import hashlib
 import logging
-import time
 import datetime
 import locale
-import time
 from urllib import parse
 
 from urllib.parse import urljoin
@@ -29,7 +27,7 @@ from urllib.parse import urljoin
 from collections import namedtuple
 from typing import Tuple
 
-from selenium.common.exceptions import ElementClickInterceptedException, NoSuchElementException
+from selenium.common.exceptions import ElementClickInterceptedException, NoSuchElementException, TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 
@@ -79,7 +77,7 @@ class TelegraafScraper(SeleniumLoginMixin, SeleniumMixin, DateRangeScraper, Dedu
         self.wait(self.login_password_field).send_keys(password)
         self.wait(self.login_password_field).send_keys(Keys.ENTER)
 
-        time.sleep(3)
+        self.wait_network_idle()
 
         try:
             self.wait(self.login_error_selector, timeout=2)
@@ -125,7 +123,6 @@ class TelegraafScraper(SeleniumLoginMixin, SeleniumMixin, DateRangeScraper, Dedu
 
                 for article in articles:
                     self.click(article)
-                    time.sleep(1.5)
 
                     try:
                         self.browser.switch_to_frame(self.wait("iframe.article-contents", timeout=10))
@@ -155,18 +152,23 @@ class TelegraafScraper(SeleniumLoginMixin, SeleniumMixin, DateRangeScraper, Dedu
                     self.browser.switch_to_default_content()
                     # Close modal
                     self.wait(".article-modal-default-button").click()
-                    time.sleep(0.5)
+                    self.wait_gone(".article-modal-default-button", timeout=10)
 
+                active_page = self.wait(".pages-swiper-slide-active")
                 self.next_button().click()
-                time.sleep(0.5)
+                try:
+                    self.wait_until(lambda: active_page not in self.browser.find_elements_by_css_selector(".pages-swiper-slide-active"),
+                                    timeout=5, description="next page")
+                except TimeoutException:
+                    pass
 
     def get_deduplicate_units(self):
-        for date in self.dates:
-            print(f"datum={date}")
-            if self.editions is not None:
-                for edition in self.editions:
-                    yield from self._get_deduplicate_units(date, edition)
-            else:
+        if self.editions is not None:
+            for date, edition in self.iter_dates(self.editions):
+                yield from self._get_deduplicate_units(date, edition)
+        else:
+            for date in self.iter_dates():
+                print(f"datum={date}")
                 yield from self._get_deduplicate_units(date)
 
     def scrape_unit(self, unit: TelegraafUnit):
@@ -0,0 +1,152 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Write-ahead spool for article batches. Every batch is written to disk before it is
+uploaded, and marked as done when AmCAT returned its ids. Batches of a crashed or failed
+run stay behind and can be uploaded later using 'scrape.py flush-spool'.
+
+A spool file is a JSON-lines journal owned (and locked) by a single scraper run. It contains
+two kinds of records:
+
+    {"batch": 3, "project": 1, "articleset": 2, "articles": [...]}
+    {"done": 3}
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+
+from typing import Callable, Iterable, List, Tuple
+
+log = logging.getLogger(__name__)
+
+SPOOL_DIR = os.path.expanduser("~/.cache/scraperspool")
+
+
+def _read_pending(fh) -> List[dict]:
+    fh.seek(0)
+    batches = {}
+    for n, line in enumerate(fh, start=1):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Probably a partially written last line of a crashed run
+            log.warning("Ignoring corrupt record on line {} of {}".format(n, fh.name))
+            continue
+
+        if "done" in record:
+            batches.pop(record["done"], None)
+        else:
+            batches[record["batch"]] = record
+    return list(batches.values())
+
+
+class Spool(object):
+    def __init__(self, name: str, directory=SPOOL_DIR, encoder=None):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "{}-{}.jsonl".format(name, uuid.uuid4()))
+        self.encoder = encoder
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.pending = set()
+        self.dirty = False
+        self.fh = None
+
+    def _open(self):
+        if self.fh is None:
+            self.fh = open(self.path, "a+", encoding="utf-8")
+            fcntl.flock(self.fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _write(self, record: dict):
+        self.fh.write(json.dumps(record, cls=self.encoder) + "\n")
+        self.fh.flush()
+
+    def append(self, project_id: int, articleset_id: int, articles: List[dict]) -> int:
+        """Write a batch to the spool. It is not guaranteed to be on disk until sync() is called."""
+        with self.lock:
+            self._open()
+            batch_id = self.next_id
+            self.next_id += 1
+            self._write({"batch": batch_id, "project": project_id,
+                         "articleset": articleset_id, "articles": articles})
+            self.pending.add(batch_id)
+            self.dirty = True
+            return batch_id
+
+    def sync(self):
+        """Make sure all appended batches are on disk. A single fsync covers all batches
+        appended since the previous call."""
+        with self.lock:
+            if self.dirty:
+                os.fsync(self.fh.fileno())
+                self.dirty = False
+
+    def commit(self, batch_id: int):
+        """Mark batch as uploaded. Once all batches are done, the journal is emptied."""
+        with self.lock:
+            self.pending.discard(batch_id)
+            if self.pending:
+                self._write({"done": batch_id})
+            else:
+                self.fh.truncate(0)
+
+    def close(self):
+        """Close the spool, removing it if all batches were uploaded"""
+        with self.lock:
+            if self.fh is None:
+                return
+            if self.pending:
+                log.warning("{} batch(es) were not uploaded, use 'scrape.py flush-spool' to retry. "
+                            "Spool: {}".format(len(self.pending), self.path))
+            else:
+                os.remove(self.path)
+            self.fh.close()
+            self.fh = None
+
+
+def flush(upload: Callable[[int, int, List[dict]], Iterable[dict]], directory=SPOOL_DIR) -> Tuple[int, int]:
+    """
+    Upload all pending batches in spools which are not in use by a running scraper.
+
+    :param upload: function called with (project_id, articleset_id, articles)
+    :return: (number of uploaded batches, number of uploaded articles)
+    """
+    nbatches = narticles = 0
+    for path in sorted(glob.glob(os.path.join(directory, "*.jsonl"))):
+        with open(path, "a+", encoding="utf-8") as fh:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                log.info("Skipping {}: in use by a running scraper".format(path))
+                continue
+
+            for batch in _read_pending(fh):
+                log.info("Uploading {} articles from {}".format(len(batch["articles"]), path))
+                upload(batch["project"], batch["articleset"], batch["articles"])
+                fh.write(json.dumps({"done": batch["batch"]}) + "\n")
+                fh.flush()
+                nbatches += 1
+                narticles += len(batch["articles"])
+
+            os.remove(path)
+
+    return nbatches, narticles
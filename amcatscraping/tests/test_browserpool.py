@@ -0,0 +1,72 @@
+import unittest
+
+from amcatscraping.browserpool import BrowserPool
+
+
+class FakeSwitchTo(object):
+    def window(self, handle):
+        pass
+
+
+class FakeBrowser(object):
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.quitted = False
+        self.window_handles = ["main"]
+        self.switch_to = FakeSwitchTo()
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise ConnectionError("browser died")
+        return 1
+
+    def quit(self):
+        self.quitted = True
+
+
+class BrowserPoolTest(unittest.TestCase):
+    def test_reuse(self):
+        pool = BrowserPool()
+        lease = pool.lease("a", FakeBrowser)
+        lease.logged_in = True
+        pool.release(lease)
+
+        self.assertIs(lease, pool.lease("a", FakeBrowser))
+        self.assertTrue(lease.logged_in)
+
+        # Leased browsers and browsers with other keys are not handed out
+        self.assertIsNot(lease, pool.lease("a", FakeBrowser))
+        pool.release(lease)
+        self.assertIsNot(lease, pool.lease("b", FakeBrowser))
+
+    def test_recycle(self):
+        pool = BrowserPool(max_pages=10)
+        lease = pool.lease("a", FakeBrowser)
+        lease.pages = 5
+        pool.release(lease)
+        lease.browser.healthy = False
+        self.assertIsNot(lease, pool.lease("a", FakeBrowser))
+        self.assertTrue(lease.browser.quitted)
+
+        lease = pool.lease("a", FakeBrowser)
+        lease.pages = 10
+        pool.release(lease)
+        self.assertTrue(lease.browser.quitted)
+
+        lease = pool.lease("a", FakeBrowser)
+        pool.release(lease, reuse=False)
+        self.assertTrue(lease.browser.quitted)
+
+    def test_max_idle(self):
+        pool = BrowserPool(max_idle=2)
+        leases = [pool.lease(key, FakeBrowser) for key in "abc"]
+        for lease in leases:
+            pool.release(lease)
+        self.assertEqual([True, False, False], [l.browser.quitted for l in leases])
+
+        pool.close()
+        self.assertTrue(all(l.browser.quitted for l in leases))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import os
+import tempfile
+import unittest
+
+from amcatscraping.checkpoint import Checkpoints
+
+
+class CheckpointsTest(unittest.TestCase):
+    def test_commit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoints = Checkpoints("test_1_2", directory=directory)
+            self.assertEqual(set(), checkpoints.completed())
+
+            checkpoints.commit(["2019-01-01"])
+            checkpoints.commit([])
+            Checkpoints("test_1_2", directory=directory).commit(["2019-01-02/1"])
+            self.assertEqual({"2019-01-01", "2019-01-02/1"}, checkpoints.completed())
+
+    def test_corrupt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoints = Checkpoints("test", directory=directory)
+            with open(os.path.join(directory, "test.json"), "w") as fh:
+                fh.write("[\"2019-01")
+            self.assertEqual(set(), checkpoints.completed())
+            checkpoints.commit(["2019-01-03"])
+            self.assertEqual({"2019-01-03"}, checkpoints.completed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+from amcatscraping.dedup import FileStore, BloomStore, BloomFilter, get_store
+
+
+class FileStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_contains(self):
+        store = FileStore(self.dir)
+        store.add("ns", [b"a", b"bb", b"x" * 16])
+        self.assertEqual([True, False, True, True], store.contains("ns", [b"a", b"b", b"bb", b"x" * 16]))
+        self.assertEqual([False], store.contains("other", [b"a"]))
+
+        # A new instance (i.e., another process) sees the same data
+        self.assertEqual([True], FileStore(self.dir).contains("ns", [b"bb"]))
+
+    def test_grow(self):
+        store = FileStore(self.dir)
+        keys = [str(i).encode() for i in range(50000)]
+        store.add("ns", keys)
+        other = FileStore(self.dir)
+        self.assertEqual(50000, other.count("ns"))
+        self.assertTrue(all(other.contains("ns", keys)))
+        self.assertEqual(set(keys), set(other.iter_keys("ns")))
+
+
+class BloomStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_filter(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(str(i).encode())
+        self.assertTrue(all(str(i).encode() in bloom for i in range(1000)))
+        false_positives = sum(str(i).encode() in bloom for i in range(1000, 11000))
+        self.assertLess(false_positives, 100)
+
+    def test_store(self):
+        FileStore(self.dir).add("ns", [b"existing"])
+        store = get_store("bloom+file", self.dir)
+        self.assertIsInstance(store, BloomStore)
+        self.assertEqual([True, False], store.contains("ns", [b"existing", b"new"]))
+        store.add("ns", [b"new"])
+        self.assertEqual([True, True], store.contains("ns", [b"existing", b"new"]))
+
+    def test_other_writer(self):
+        store = BloomStore(FileStore(self.dir), resync_interval=0)
+        other = get_store("bloom+file", self.dir)
+        self.assertEqual([False], store.contains("ns", [b"a"]))
+        other.add("ns", [b"a"])
+        self.assertEqual([True], store.contains("ns", [b"a"]))
+
+    def test_no_io_for_new_keys(self):
+        exact = FileStore(self.dir)
+        exact.add("ns", [b"existing"])
+        store = BloomStore(exact)
+        store.contains("ns", [b"existing"])
+        with mock.patch.object(exact, "count") as count, mock.patch.object(exact, "contains") as contains:
+            self.assertEqual([False, False], store.contains("ns", [b"new", b"other"]))
+            store.add("ns", [b"new"])
+        count.assert_not_called()
+        contains.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import csv
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from amcatscraping.downloads import stream_download
+
+
+def download(directory, name, chunks):
+    """Write chunks like Firefox does: to a .part file, renamed when complete"""
+    path = os.path.join(directory, name)
+    open(path, "wb").close()
+    with open(path + ".part", "wb") as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+            fh.flush()
+            time.sleep(0.05)
+    os.replace(path + ".part", path)
+
+
+class StreamDownloadTest(unittest.TestCase):
+    def _test_stream(self, **kwargs):
+        chunks = ["\ufefftitel;url\n".encode("utf-8"), b"a;http://a", b"\nb;\"http://b\n", b"c\"\n"]
+        with tempfile.TemporaryDirectory() as directory:
+            thread = threading.Thread(target=download, args=(directory, "export.csv", chunks))
+            thread.start()
+            rows = csv.DictReader(stream_download(directory, "*.csv", timeout=5, **kwargs), delimiter=";")
+            self.assertEqual({"titel": "a", "url": "http://a"}, next(rows))
+            # The first row is available before the download finished
+            self.assertTrue(thread.is_alive())
+            self.assertEqual([{"titel": "b", "url": "http://b\nc"}], list(rows))
+            thread.join()
+            self.assertEqual([], os.listdir(directory))
+
+    def test_inotify(self):
+        self._test_stream()
+
+    def test_polling(self):
+        self._test_stream(inotify=False, poll_interval=0.01)
+
+    def test_timeout(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertRaises(IOError, list, stream_download(directory, "*.csv", timeout=0.05))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+import requests
+
+from amcatscraping.httpcache import ResponseCache, get_cache
+from amcatscraping.httpsession import Session
+
+
+def make_response(url, content, status=200, **headers):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.headers.update(headers)
+    response._content = content
+    return response
+
+
+class RecordingSession(Session):
+    """Session returning prepared responses instead of doing requests"""
+    def __init__(self, responses, **kwargs):
+        super().__init__(**kwargs)
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, link, tries=3, **kwargs):
+        self.requests.append((link, kwargs.get("headers") or {}))
+        return self.responses.pop(0)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store(self):
+        cache = ResponseCache(self.path)
+        key = cache.get_key("http://example.com/", {})
+        self.assertIsNone(cache.lookup(key))
+        cache.store(key, make_response("http://example.com/", b"<p>test</p>", ETag='"1"'))
+        cache.close()
+
+        cached = ResponseCache(self.path).lookup(key)
+        self.assertEqual(b"<p>test</p>", cached.content)
+        self.assertEqual('"1"', cached.headers["etag"])
+        self.assertNotEqual(key, cache.get_key("http://example.com/", {"Accept": "application/json"}))
+
+    def test_ttl(self):
+        cache = get_cache({"enabled": "yes", "path": self.path, "ttl": "10", "ttl.example.com": "60"})
+        self.assertEqual(60, cache.get_ttl("http://www.example.com/a"))
+        self.assertEqual(10, cache.get_ttl("http://example.org/a"))
+        self.assertIsNone(get_cache({"path": self.path}))
+
+    def test_evict(self):
+        cache = ResponseCache(self.path, max_size=2500)
+        for i in range(5):
+            key = cache.get_key(str(i), {})
+            cache.store(key, make_response(str(i), os.urandom(1000)))
+        self.assertLessEqual(cache.size, 2500)
+        self.assertIsNone(cache.lookup(cache.get_key("0", {})))
+        self.assertIsNotNone(cache.lookup(cache.get_key("4", {})))
+
+    def test_revalidate(self):
+        url = "http://example.com/"
+        session = RecordingSession([
+            make_response(url, b"old", ETag='"1"'),
+            make_response(url, b"", status=304),
+            make_response(url, b"new", ETag='"2"'),
+        ], cache=ResponseCache(self.path))
+
+        self.assertEqual("old", session.get_content(url))
+        self.assertEqual("old", session.get_content(url))
+        self.assertEqual('"1"', session.requests[1][1]["If-None-Match"])
+        self.assertEqual("new", session.get_content(url))
+
+        session.cache.default_ttl = 60
+        self.assertEqual("new", session.get_content(url))
+        self.assertEqual(3, len(session.requests))
+
+
+if __name__ == '__main__':
+    unittest.main()
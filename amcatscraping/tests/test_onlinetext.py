@@ -0,0 +1,136 @@
+import collections
+import http.server
+import threading
+import time
+import unittest
+
+from amcatscraping.onlinetext import HostPool, NoScraper, ScraperRouter, scrape_texts
+from amcatscraping.scrapers.news.online_scrapers import NOSScraper, NUScraper, Scraper
+
+
+class SiteScraper(object):
+    def __init__(self, domain):
+        self.DOMAIN = domain
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def can_scrape(self, link):
+        return self.DOMAIN in link
+
+    def scrape_text(self, link):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        if link.endswith("error"):
+            raise ValueError(link)
+        return "text of " + link
+
+
+class ScrapeTextsTest(unittest.TestCase):
+    def test_scrape_texts(self):
+        a, b = SiteScraper("a.nl"), SiteScraper("b.nl")
+        links = ["http://a.nl/{}".format(i) for i in range(10)] + ["http://b.nl/{}".format(i) for i in range(10)]
+        links += ["http://b.nl/error", "http://c.nl/1"]
+
+        texts = scrape_texts(links, ScraperRouter([a, b]), workers=8, per_host=2)
+        self.assertEqual("text of http://a.nl/3", texts["http://a.nl/3"])
+        self.assertIsInstance(texts["http://b.nl/error"], ValueError)
+        self.assertIsInstance(texts["http://c.nl/1"], NoScraper)
+        self.assertEqual(2, a.max_active)
+        self.assertEqual(2, b.max_active)
+
+    def test_scrape_texts_async(self):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                status = 404 if self.path == "/missing" else 200
+                body = "<html><body><p>{}</p><p>{}</p></body></html>".format(self.path, self.headers["Cookie"])
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html")
+                self.end_headers()
+                self.wfile.write(body.encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        class LocalScraper(Scraper):
+            URL_MATCH = "http://127.0.0.1"
+            SKIP_NOT_FOUND = True
+
+            def initialize(self):
+                self.session.cookies.set("consent", "yes", domain="127.0.0.1")
+
+            def parse_html(self, page):
+                return "\n\n".join(p.text_content() for p in page.xpath("//p"))
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            base = "http://127.0.0.1:{}".format(server.server_port)
+            texts = scrape_texts([base + "/a", base + "/missing"], ScraperRouter([LocalScraper()]))
+        finally:
+            server.shutdown()
+        self.assertEqual("/a\n\nconsent=yes", texts[base + "/a"])
+        self.assertIsNone(texts[base + "/missing"])
+
+
+class HostPoolTest(unittest.TestCase):
+    def test_host_pool(self):
+        active, maximum = collections.Counter(), collections.Counter()
+        lock = threading.Lock()
+
+        def work(host, n):
+            with lock:
+                active[host] += 1
+                maximum[host] = max(maximum[host], active[host])
+            time.sleep(0.01 if host == "fast" else 0.05)
+            with lock:
+                active[host] -= 1
+            return n
+
+        pool = HostPool(workers=4, per_host=2)
+        for n in range(6):
+            pool.submit("slow", ("slow", n), work, "slow", n)
+            pool.submit("fast", ("fast", n), work, "fast", n)
+
+        results = []
+        while pool.pending:
+            key, future = pool.get()
+            self.assertEqual(key[1], future.result())
+            results.append(key[0])
+        pool.shutdown()
+
+        self.assertEqual({"slow": 2, "fast": 2}, dict(maximum))
+        # Fast hosts are not held up by slow ones
+        self.assertEqual(["fast"] * 6, results[:6])
+
+
+class ScraperRouterTest(unittest.TestCase):
+    def test_route(self):
+        class Legacy(object):
+            def can_scrape(self, link):
+                return "legacy" in link
+
+        nu, video, legacy = SiteScraper("nu.nl"), SiteScraper("nu.nl"), Legacy()
+        router = ScraperRouter([legacy])
+        router.add(video, pattern=r"https://([^/]*\.)?nu\.nl/video/")
+        router.add(nu)
+
+        self.assertIs(nu, router.route("https://www.nu.nl/politiek/1.html"))
+        self.assertIs(video, router.route("https://nu.nl/video/1.html"))
+        self.assertIs(legacy, router.route("https://legacy.example.com/"))
+        self.assertRaises(NoScraper, router.route, "https://example.com/")
+
+    def test_online_scrapers(self):
+        nu, nos = NUScraper(), NOSScraper()
+        router = ScraperRouter([nu, nos])
+        self.assertIs(nu, router.route("https://www.nu.nl/politiek/1.html"))
+        self.assertIs(nos, router.route("https://nos.nl/artikel/1.html"))
+        self.assertRaises(NoScraper, router.route, "https://www.nu.nl.example.com/")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from amcatscraping.ratelimit import HostPolicy, RateLimiter, get_limiter, parse_retry_after
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_rate(self):
+        limiter = RateLimiter(HostPolicy(rate=20, max_rate=20, concurrency=0, latency=2.0))
+        start = time.monotonic()
+        for _ in range(5):
+            with limiter.request("http://example.com/"):
+                pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+        # Other hosts have their own bucket
+        start = time.monotonic()
+        with limiter.request("http://example.org/"):
+            pass
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def test_concurrency(self):
+        limiter = RateLimiter(HostPolicy(rate=0, max_rate=0, concurrency=2, latency=2.0))
+        active, maximum = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with limiter.request("http://example.com/"):
+                with lock:
+                    active[0] += 1
+                    maximum[0] = max(maximum[0], active[0])
+                time.sleep(0.02)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, maximum[0])
+
+    def test_request_async(self):
+        limiter = RateLimiter(HostPolicy(rate=20, max_rate=20, concurrency=1, latency=2.0))
+        active, maximum = [0], [0]
+
+        async def work():
+            with await limiter.request_async("http://example.com/"):
+                active[0] += 1
+                maximum[0] = max(maximum[0], active[0])
+                await asyncio.sleep(0.01)
+                active[0] -= 1
+
+        async def main():
+            await asyncio.gather(*(work() for _ in range(5)))
+
+        start = time.monotonic()
+        asyncio.run(main())
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(1, maximum[0])
+
+    def test_backoff(self):
+        limiter = RateLimiter(HostPolicy(rate=10, max_rate=20, concurrency=0, latency=2.0))
+        slot = limiter.request("http://example.com/")
+        slot.failed(retry_after=0.1)
+        self.assertEqual(5, slot.state.rate)
+
+        start = time.monotonic()
+        with limiter.request("http://example.com/") as slot:
+            pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertEqual(6, slot.state.rate)
+
+    def test_config(self):
+        limiter = get_limiter({"rate": "2", "concurrency": "4", "rate.nrc.nl": "0.5", "max_rate.nrc.nl": "1"})
+        self.assertEqual(HostPolicy(2, 2, 4, 2.0), limiter.get_policy("www.nos.nl"))
+        self.assertEqual(HostPolicy(0.5, 1, 4, 2.0), limiter.get_policy("www.nrc.nl"))
+
+    def test_retry_after(self):
+        self.assertEqual(120, parse_retry_after("120"))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(0, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+
+
+if __name__ == '__main__':
+    unittest.main()
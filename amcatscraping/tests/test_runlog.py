@@ -0,0 +1,56 @@
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from amcatscraping.runlog import RunLog
+
+
+class RunLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "runs.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_runs(self):
+        today = datetime.date.today()
+        yesterday = time.time() - 24 * 3600
+        run_log = RunLog(self.path, legacy_dir=None)
+        a = run_log.add("a", 10, False, "log of a\n" * 100)
+        b = run_log.add("b", 0, True, "log of b", update=True)
+        old = run_log.add("a", 5, False, "old log of a", timestamp=yesterday)
+
+        run = run_log.get_run(b)
+        self.assertEqual(("b", 0, 1, 1, "log of b"), (run["label"], run["narticles"], run["update"], run["failed"], run["log"]))
+        self.assertIsNone(run_log.get_run("nonexisting"))
+
+        # Every scraper of a run is kept, ordered by label and time
+        self.assertEqual([a, b], [r["uuid"] for r in run_log.get_runs(today)])
+        self.assertEqual([old, a], [r["uuid"] for r in run_log.get_runs(today - datetime.timedelta(days=7), today, ["a"])])
+        self.assertNotIn("log", run_log.get_runs(today)[0])
+
+    def test_import_legacy(self):
+        legacy_dir = os.path.join(self.directory.name, "scraperlogs")
+        os.makedirs(os.path.join(legacy_dir, "2019-03-01"))
+        timestamp = int(time.mktime(datetime.datetime(2019, 3, 1, 12).timetuple()))
+        with open(os.path.join(legacy_dir, "2019-03-01", "1234.json"), "w") as fh:
+            json.dump({"narticles": 3, "log": "legacy log", "label": "ad", "timestamp": timestamp,
+                       "update": False, "uuid": "1234", "failed": False}, fh)
+
+        run_log = RunLog(self.path, legacy_dir=legacy_dir)
+        self.assertEqual("legacy log", run_log.get_run("1234")["log"])
+        self.assertEqual(["1234"], [r["uuid"] for r in run_log.get_runs(datetime.date(2019, 3, 1))])
+        run_log.close()
+
+        # Legacy logs are only imported when the database is created
+        os.remove(os.path.join(legacy_dir, "2019-03-01", "1234.json"))
+        run_log.add("ad", 1, False, "")
+        self.assertEqual(2, len(RunLog(self.path, legacy_dir=legacy_dir).get_runs(datetime.date(2019, 3, 1), datetime.date.today())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import logging
+import unittest
+
+from amcatscraping.scrape import capture_logs
+
+
+class CaptureLogsTest(unittest.TestCase):
+    def test_capture_once(self):
+        logger = logging.getLogger("amcatscraping.tests.capture")
+        with capture_logs(("",)) as log_buffer:
+            logger.warning("hello")
+        self.assertEqual("hello\n", log_buffer.getvalue())
+
+    def test_not_propagating(self):
+        parent = logging.getLogger("amcatscraping.tests.quiet")
+        parent.propagate = False
+        try:
+            with capture_logs(("",)) as log_buffer:
+                logging.getLogger("amcatscraping.tests.quiet.child").warning("hello")
+            self.assertEqual("hello\n", log_buffer.getvalue())
+        finally:
+            parent.propagate = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import amcatscraping.setup_django  # noqa: F401 (configures Django for amcat.models)
+
+import datetime
+import functools
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from amcat.models import Article
+
+from amcatscraping.scraper import ArticleTree, Scraper
+from amcatscraping.spool import Spool
+
+
+class StubAPI(object):
+    """Assigns ids to created articles instead of uploading them"""
+    def __init__(self):
+        self.batches = []
+
+    def create_articles(self, project, articleset, json_data):
+        self.batches.append(json_data)
+        return [{"id": 100 * len(self.batches) + i} for i in range(len(json_data))]
+
+
+class TreeScraper(Scraper):
+    def _api_auth(self):
+        return StubAPI()
+
+    def scrape(self):
+        for i in range(3):
+            url = "http://example.com/{}".format(i)
+            comment = Article(title="comment", text="comment", date=datetime.datetime(2020, 1, 1), url=url + "#c")
+            yield ArticleTree(Article(title="article", text="text", date=datetime.datetime(2020, 1, 1), url=url), [comment])
+
+
+class RunTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_run(self):
+        scraper = TreeScraper(project_id=1, articleset_id=2, batch_size=4, deduplicate_on_url=False)
+        with mock.patch("amcatscraping.scraper.Spool", functools.partial(Spool, directory=self.directory.name)):
+            articles = scraper.run()
+
+        # Trees are flattened, parents first, and uploaded in batches of at least batch_size
+        self.assertEqual(6, len(articles))
+        self.assertEqual([4, 2], [len(batch) for batch in scraper.api.batches])
+        self.assertEqual([100, 101, 102, 103, 200, 201], [a.id for a in articles])
+        self.assertEqual(articles[0].hash, articles[1].parent_hash)
+
+        # All batches were uploaded, so the spool is removed
+        self.assertEqual([], os.listdir(self.directory.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import fcntl
+import os
+import shutil
+import tempfile
+import unittest
+
+from amcatscraping import spool
+
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_commit_all(self):
+        s = spool.Spool("test", directory=self.dir)
+        a = s.append(1, 2, [{"title": "a"}])
+        b = s.append(1, 2, [{"title": "b"}])
+        s.sync()
+        s.commit(a)
+        s.commit(b)
+        self.assertEqual(0, os.path.getsize(s.path))
+        s.close()
+        self.assertEqual([], os.listdir(self.dir))
+
+    def test_flush(self):
+        s = spool.Spool("test", directory=self.dir)
+        a = s.append(1, 2, [{"title": "a"}])
+        s.append(1, 3, [{"title": "b"}, {"title": "c"}])
+        s.commit(a)
+
+        # Spool in use: flush should not touch it
+        uploaded = []
+        upload = lambda *args: uploaded.append(args)
+        self.assertEqual((0, 0), spool.flush(upload, directory=self.dir))
+
+        s.close()
+        self.assertEqual((1, 2), spool.flush(upload, directory=self.dir))
+        self.assertEqual([(1, 3, [{"title": "b"}, {"title": "c"}])], uploaded)
+        self.assertEqual([], os.listdir(self.dir))
+
+    def test_corrupt_line(self):
+        s = spool.Spool("test", directory=self.dir)
+        s.append(1, 2, [{"title": "a"}])
+        s.fh.write('{"batch": 1, "proj')
+        s.fh.flush()
+        fcntl.flock(s.fh, fcntl.LOCK_UN)
+
+        uploaded = []
+        self.assertEqual((1, 1), spool.flush(lambda *args: uploaded.append(args), directory=self.dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
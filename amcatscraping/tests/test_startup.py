@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+HEAVY_MODULES = ["django", "selenium", "amcatclient", "jinja2", "redis", "amcatscraping.scraper"]
+
+# Run the CLI like 'python -m amcatscraping.scrape', then report which heavy modules it imported
+SCRIPT = """
+import runpy, sys
+sys.argv = ["scrape.py"] + sys.argv[1:]
+runpy.run_module("amcatscraping.scrape", run_name="__main__")
+print("imported:", ",".join(m for m in {heavy!r} if m in sys.modules))
+""".format(heavy=HEAVY_MODULES)
+
+
+class StartupTest(unittest.TestCase):
+    def _run(self, *args):
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ, HOME=home)
+            start = time.monotonic()
+            output = subprocess.check_output([sys.executable, "-c", SCRIPT] + list(args), env=env,
+                                             universal_newlines=True)
+            return time.monotonic() - start, output.strip().splitlines()
+
+    def test_startup(self):
+        for command in (["list"], ["report"], ["log", "nonexisting"]):
+            elapsed, output = self._run(*command)
+            self.assertLess(elapsed, 1.0, "scrape.py {} took {:.2f}s".format(command[0], elapsed))
+            self.assertEqual("imported:", output[-1].strip(), "scrape.py {} imported heavy modules".format(command[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import threading
+import unittest
+
+from amcatscraping.uploader import Uploader
+
+
+class UploaderTest(unittest.TestCase):
+    def test_order(self):
+        uploader = Uploader(lambda batch: [i * 2 for i in batch], queue_size=1)
+        for i in range(10):
+            uploader.put([i, i + 100])
+        self.assertEqual([i * 2 for b in range(10) for i in (b, b + 100)], list(uploader.close()))
+
+    def test_synchronous(self):
+        uploader = Uploader(lambda batch: batch, queue_size=0)
+        uploader.put([1, 2])
+        self.assertEqual([1, 2], list(uploader.completed()))
+        uploader.put([3])
+        self.assertEqual([3], list(uploader.close()))
+
+    def test_backpressure(self):
+        release = threading.Event()
+
+        def save(batch):
+            release.wait()
+            return batch
+
+        uploader = Uploader(save, queue_size=1)
+        uploader.put([1])  # picked up by the uploader thread, which blocks
+        uploader.put([2])  # fills the queue
+        self.assertTrue(uploader.batches.full())
+        release.set()
+        uploader.put([3])
+        self.assertEqual([1, 2, 3], list(uploader.close()))
+
+    def test_error(self):
+        def save(batch):
+            raise ValueError("API down")
+
+        uploader = Uploader(save, queue_size=2)
+        uploader.put([1])
+        uploader.thread.join()
+        self.assertRaises(ValueError, uploader.put, [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from amcatscraping.workqueue import WorkQueue
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "articles.db")
+        db = sqlite3.connect(self.path)
+        with db:
+            db.execute("CREATE TABLE articles (public_link TEXT, title TEXT, status TEXT)")
+            db.executemany("INSERT INTO articles VALUES (?, ?, 'public')",
+                           [("http://example.com/{}'s".format(i), str(i)) for i in range(5)])
+        db.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_claim(self):
+        a = WorkQueue(self.path, "articles", key="public_link")
+        b = WorkQueue(self.path, "articles", key="public_link")
+
+        claimed_a = a.claim(3, "public", columns="public_link as url, title")
+        claimed_b = b.claim(3, "public", columns="public_link as url")
+        self.assertEqual(3, len(claimed_a))
+        self.assertEqual(2, len(claimed_b))
+        self.assertFalse({r["url"] for r in claimed_a} & {r["url"] for r in claimed_b})
+        self.assertEqual([], a.claim(3, "public"))
+        self.assertEqual(5, a.get_leased())
+
+        a.complete([r["url"] for r in claimed_a], "done")
+        b.release([r["url"] for r in claimed_b])
+        self.assertEqual({"done": 3, "public": 2}, a.get_counts())
+        self.assertEqual(3, a.get_completed(60))
+        self.assertEqual(2, len(a.claim(3, "public")))
+
+    def test_fail(self):
+        queue = WorkQueue(self.path, "articles", key="public_link")
+        link = queue.claim(1, "public", columns="public_link as url")[0]["url"]
+        queue.fail([link], "error", max_attempts=2, delay=0.05)
+        self.assertEqual(0, queue.get_leased())
+
+        # Not claimed again until the delay passed
+        self.assertNotIn(link, [r["url"] for r in queue.claim(10, "public", columns="public_link as url")])
+        time.sleep(0.06)
+        self.assertEqual([link], [r["url"] for r in queue.claim(1, "public", columns="public_link as url")])
+        queue.fail([link], "error", max_attempts=2)
+        self.assertEqual({"public": 4, "error": 1}, queue.get_counts())
+
+    def test_put(self):
+        queue = WorkQueue(self.path, "articles", key="public_link")
+        queue.put([{"public_link": "http://example.com/new", "title": "new"}], "public")
+        self.assertEqual({"public": 6}, queue.get_counts())
+
+    def test_expired_lease(self):
+        crashed = WorkQueue(self.path, "articles", key="public_link", lease=0.01)
+        self.assertEqual(5, len(crashed.claim(10, "public")))
+        time.sleep(0.02)
+        self.assertEqual(5, len(WorkQueue(self.path, "articles", key="public_link").claim(10, "public")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,9 +26,6 @@ import datetime
 import errno
 import json
 
-from html2text import HTML2Text
-from lxml import html, etree
-
 log = logging.getLogger(__name__)
 
 ### MISC ###
@@ -46,6 +43,8 @@ def get_boolean(v):
 
 
 def _html2text(data, handler):
+    from lxml import html, etree
+
     if isinstance(data, bytes):
         raise ValueError("You supplied bytes. Please decode at borders of I/O!!")
 
@@ -60,6 +59,9 @@ def _html2text(data, handler):
 
 
 def html2text(data, bodywidth=0, baseurl='', ignore_links=True, ignore_images=True):
+    # Imported here, as scrape.py uses this module and should start quickly
+    from html2text import HTML2Text
+
     handler = HTML2Text(baseurl=baseurl, bodywidth=bodywidth)
     handler.ignore_links = ignore_links
     handler.ignore_images = ignore_images
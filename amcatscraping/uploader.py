@@ -0,0 +1,112 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""Background upload stage, so scraping can continue while earlier batches are saved"""
+import logging
+import queue
+import threading
+
+from typing import Callable, Iterable, List, Any
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Uploader(object):
+    """
+    Saves batches by calling save(batch) in a background thread. At most queue_size batches
+    wait for upload: put() blocks when the queue is full, which keeps a fast scraper from
+    running arbitrarily far ahead of a slow API. Batches are saved in the order they were put.
+
+    With queue_size=0 batches are saved synchronously in put(), which is the old behaviour.
+    """
+    def __init__(self, save: Callable[[List[Any]], Iterable[Any]], queue_size=2):
+        self.save = save
+        self.queue_size = queue_size
+        self.saved = queue.Queue()
+        self.error = None
+
+        if queue_size > 0:
+            self.batches = queue.Queue(maxsize=queue_size)
+            self.thread = threading.Thread(target=self._work, name="uploader", daemon=True)
+            self.thread.start()
+        else:
+            self.batches = None
+            self.thread = None
+
+    def _work(self):
+        while True:
+            batch = self.batches.get()
+            if batch is _STOP:
+                return
+
+            try:
+                self.saved.put(list(self.save(batch)))
+            except BaseException as e:
+                self.error = e
+                return
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _put(self, item):
+        while True:
+            self._raise_error()
+            if not self.thread.is_alive():
+                return
+            try:
+                self.batches.put(item, timeout=1)
+            except queue.Full:
+                log.debug("Upload queue full, waiting for uploader..")
+            else:
+                return
+
+    def put(self, batch: List[Any]):
+        """Queue batch for upload. Raises the error of a failed upload, if any."""
+        if self.thread is None:
+            self.saved.put(list(self.save(batch)))
+        else:
+            self._put(batch)
+
+    def completed(self) -> Iterable[Any]:
+        """Yield all items of batches saved so far, without blocking"""
+        self._raise_error()
+        while True:
+            try:
+                yield from self.saved.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self) -> Iterable[Any]:
+        """Wait for all queued batches to be saved and yield their items"""
+        if self.thread is not None:
+            self._put(_STOP)
+            self.thread.join()
+        yield from self.completed()
+
+    def abort(self):
+        """Wait for queued batches to be saved, but log instead of raise upload errors. Used to
+        clean up when scraping itself failed."""
+        try:
+            for _ in self.close():
+                pass
+        except Exception:
+            log.exception("Uploading remaining batches failed:")
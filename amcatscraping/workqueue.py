@@ -0,0 +1,163 @@
+###########################################################################
+#          (C) Vrije Universiteit, Amsterdam (the Netherlands)            #
+#                                                                         #
+# This file is part of AmCAT - The Amsterdam Content Analysis Toolkit     #
+#                                                                         #
+# AmCAT is free software: you can redistribute it and/or modify it under  #
+# the terms of the GNU Lesser General Public License as published by the  #
+# Free Software Foundation, either version 3 of the License, or (at your  #
+# option) any later version.                                              #
+#                                                                         #
+# AmCAT is distributed in the hope that it will be useful, but WITHOUT    #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+# You should have received a copy of the GNU Lesser General Public        #
+# License along with AmCAT.  If not, see <http://www.gnu.org/licenses/>.  #
+###########################################################################
+"""
+Work queue on top of an SQLite table with a status column, such as the articles table of
+the public links database. Several workers (threads or processes) can claim batches of rows:
+a claimed row is leased to its worker until it is completed (its status is changed), or until
+the lease expires, after which another worker may claim it again. Rows which failed are retried
+after a delay, until they failed max_attempts times.
+"""
+import itertools
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from typing import Dict, Iterable, List
+
+log = logging.getLogger(__name__)
+
+
+class WorkQueue(object):
+    """
+    @param path: SQLite database
+    @param table: table containing the work
+    @param key: column uniquely identifying a row
+    @param lease: number of seconds a worker may take to complete claimed rows
+    """
+    def __init__(self, path: str, table: str, key: str, lease=600.0):
+        self.table = table
+        self.key = key
+        self.lease = lease
+        self.worker = "{}:{}:{}".format(socket.gethostname(), os.getpid(), id(self))
+        self.claims = itertools.count()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self._setup()
+
+    def _setup(self):
+        with self._transaction():
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info({})".format(self.table))}
+            for column, type in (("lease", "TEXT"), ("lease_until", "REAL"), ("completed", "REAL"),
+                                 ("attempts", "INTEGER")):
+                if column not in columns:
+                    self.db.execute("ALTER TABLE {} ADD COLUMN {} {}".format(self.table, column, type))
+            self.db.execute("CREATE INDEX IF NOT EXISTS {0}_queue_status ON {0} (status)".format(self.table))
+            self.db.execute("CREATE INDEX IF NOT EXISTS {0}_queue_key ON {0} ({1})".format(self.table, self.key))
+
+    def _transaction(self):
+        return Transaction(self.db, self.lock)
+
+    def claim(self, n: int, status: str, columns="*") -> List[Dict]:
+        """
+        Lease at most n rows with the given status (which are not leased to another worker)
+        @param columns: SQL expressions of the columns to return
+        """
+        lease = "{}/{}".format(self.worker, next(self.claims))
+        now = time.time()
+        with self._transaction():
+            self.db.execute(
+                "UPDATE {0} SET lease = ?, lease_until = ? WHERE rowid IN ("
+                " SELECT rowid FROM {0} WHERE status = ? AND (lease_until IS NULL OR lease_until < ?) LIMIT ?)"
+                .format(self.table), (lease, now + self.lease, status, now, n))
+            cursor = self.db.execute("SELECT {} FROM {} WHERE lease = ?".format(columns, self.table), (lease,))
+            names = [c[0] for c in cursor.description]
+            return [dict(zip(names, row)) for row in cursor]
+
+    def put(self, rows: Iterable[Dict], status: str):
+        """Insert rows with the given status, replacing existing rows with the same key"""
+        with self._transaction():
+            for row in rows:
+                columns = list(row) + ["status", "lease", "lease_until"]
+                self.db.execute("INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+                    self.table, ", ".join(columns), ", ".join("?" * len(columns))),
+                    list(row.values()) + [status, None, None])
+
+    def complete(self, keys: Iterable, status: str):
+        """Set the status of the given rows and end their leases"""
+        now = time.time()
+        with self._transaction():
+            self.db.executemany(
+                "UPDATE {} SET status = ?, lease = NULL, lease_until = NULL, completed = ? WHERE {} = ?"
+                .format(self.table, self.key), ((status, now, key) for key in keys))
+
+    def release(self, keys: Iterable):
+        """End the leases of the given rows without changing their status, so they can be claimed again"""
+        with self._transaction():
+            self.db.executemany("UPDATE {} SET lease = NULL, lease_until = NULL WHERE {} = ?"
+                                .format(self.table, self.key), ((key,) for key in keys))
+
+    def fail(self, keys: Iterable, status: str, max_attempts: int, delay=0.0):
+        """
+        Count a failed attempt for the given rows and end their leases. Rows which failed
+        max_attempts times get the given status; others can be claimed again after delay seconds.
+        """
+        keys = list(keys)
+        now = time.time()
+        with self._transaction():
+            self.db.executemany(
+                "UPDATE {} SET attempts = COALESCE(attempts, 0) + 1, lease = NULL, lease_until = ? WHERE {} = ?"
+                .format(self.table, self.key), ((now + delay, key) for key in keys))
+            self.db.executemany(
+                "UPDATE {} SET status = ?, lease_until = NULL, completed = ? WHERE {} = ? AND attempts >= ?"
+                .format(self.table, self.key), ((status, now, key, max_attempts) for key in keys))
+
+    def get_counts(self) -> Dict[str, int]:
+        """Number of rows per status"""
+        with self.lock:
+            return dict(self.db.execute("SELECT status, count(*) FROM {} GROUP BY status".format(self.table)))
+
+    def get_leased(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT count(*) FROM {} WHERE lease IS NOT NULL AND lease_until >= ?".format(self.table),
+                                   (time.time(),)).fetchone()[0]
+
+    def get_completed(self, seconds: float) -> int:
+        """Number of rows completed in the last given number of seconds"""
+        with self.lock:
+            return self.db.execute("SELECT count(*) FROM {} WHERE completed >= ?".format(self.table),
+                                   (time.time() - seconds,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class Transaction(object):
+    """Write transaction which locks the database when it starts, so claims don't overlap"""
+    def __init__(self, db: sqlite3.Connection, lock: threading.Lock):
+        self.db = db
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     version='0.14',
@@ -32,6 +32,11 @@ setup(
         "tabulate",
         "feedparser", 'redis', 'dateparser', 'iso8601',
         "selenium",
+        "aiohttp",
         # as long as amcat dependency exists, also pip install -r amcat/requirements.txt
     ],
+    extras_require={
+        # Follow Coosto downloads without polling (Linux only)
+        "inotify": ["inotify_simple"],
+    },
 )